@@ -0,0 +1,488 @@
+##############################
+# IMPORTS
+##############################
+
+
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.basic_lang_module import create_global_symbol_table, parse, run, Lexer, Parser, Position, SourceText, Token
+
+
+##############################
+# BENCHMARKS
+##############################
+
+
+FIB = '''
+FUN fib(n) -> IF n < 2 THEN n ELSE fib(n - 1) + fib(n - 2)
+fib(20)
+'''
+
+NESTED_LOOPS = '''
+VAR total = 0
+FOR i = 0 TO 300 THEN
+    FOR j = 0 TO 300 THEN
+        VAR total = total + i * j - 1
+    END
+END
+'''
+
+DEEP_CALLS = '''
+VAR offset = 1
+FUN depth(n) -> IF n == 0 THEN 0 ELSE offset + depth(n - 1)
+FOR i = 0 TO 1000 THEN depth(60)
+'''
+
+STRING_CONCAT = '''
+VAR text = ""
+FOR i = 0 TO 20000 THEN
+    VAR text = text + "ab"
+END
+'''
+
+LIST_OPS = '''
+VAR items = []
+FOR i = 0 TO 50000 THEN
+    APPEND(items, i)
+END
+VAR total = 0
+FOR i = 0 TO 50000 THEN
+    VAR total = total + items / i
+END
+FOR i = 0 TO 50000 THEN
+    POP(items, -1)
+END
+'''
+
+CALL_OVERHEAD = '''
+FUN noop(a, b) -> a
+FOR i = 0 TO 100000 THEN
+    noop(i, 1)
+END
+'''
+
+# 100k levels of plain recursion, then 100k tail calls.
+DEEP_RECURSION = '''
+FUN build(n) -> IF n == 0 THEN [] ELSE build(n - 1) + n
+FUN count(n, total) -> IF n == 0 THEN total ELSE count(n - 1, total + n)
+VAR items = build(100000)
+VAR total = count(100000, 0)
+'''
+
+MEMO_FIB = '''
+FUN fib(n) -> IF n < 2 THEN n ELSE fib(n - 1) + fib(n - 2)
+VAR fib = MEMOIZE(fib, 1000)
+VAR total = 0
+FOR i = 0 TO 500 THEN
+    VAR total = total + fib(i)
+END
+'''
+
+# Every loop below is in expression position, so the value of each iteration
+# is kept in the loop's result list and stays visible to tracemalloc.
+ALLOCATION_LOOPS = '''
+VAR limit = 100
+VAR checks = FOR i = 0 TO 20000 THEN i * 2 < limit
+VAR reads = FOR i = 0 TO 20000 THEN limit
+VAR sums = FOR i = 0 TO 20000 THEN i * 1000 + limit
+'''
+ALLOCATION_ITERATIONS: int = 60000
+
+LIST_ACCUMULATE = '''
+VAR items = []
+FOR i = 0 TO 100000 THEN VAR items = items + i
+'''
+
+# Loops used as statements, whose values are never read. {count} is the
+# number of iterations.
+STATEMENT_LOOPS = '''
+VAR total = 0
+FOR i = 0 TO {count} THEN
+    VAR total = total + i
+END
+VAR i = 0
+WHILE i < {count} THEN
+    VAR i = i + 1
+END
+'''
+LOOP_MEMORY_COUNTS: tuple = (10000, 100000, 1000000)
+
+ARRAY_NUMERIC = '''
+VAR data = ARRAY(1000000) + 1.5
+VAR scaled = data * 2 - 1
+VAR total = SUM(scaled) + DOT(data, scaled) + MAX(scaled) - MIN(scaled)
+'''
+
+# The lex and parse timings run on a generated script of this many lines.
+PARSE_LINE_COUNT: int = 50000
+PARSE_BENCHMARK_NAMES: tuple = ('lex_50k_lines', 'parse_50k_lines')
+PARSE_MEMORY_LINE_COUNTS: tuple = (10000, 40000, 160000)
+
+# A benchmark more than this fraction slower than its baseline is flagged.
+REGRESSION_THRESHOLD: float = 0.10
+
+BENCHMARKS: dict = {
+    'fib': FIB,
+    'nested_loops': NESTED_LOOPS,
+    'string_concat': STRING_CONCAT,
+    'list_ops': LIST_OPS,
+    'call_overhead': CALL_OVERHEAD,
+    'deep_calls': DEEP_CALLS,
+    'deep_recursion': DEEP_RECURSION,
+    'memo_fib': MEMO_FIB,
+    'list_accumulate': LIST_ACCUMULATE,
+    'array_numeric': ARRAY_NUMERIC,
+}
+
+
+##############################
+# GENERATED SCRIPTS
+##############################
+
+
+def generate_script(line_count: int) -> str:
+    """Generates a large BASIC script that mixes the common statement kinds."""
+    lines: list = list()
+
+    for i in range(line_count):
+        kind: int = i % 4
+
+        if kind == 0:
+            lines.append(f'VAR v{i} = {i} * 2 + (v{i - 1 if i else 0} - 3) / 7')
+        elif kind == 1:
+            lines.append(f'IF v{i - 1} > {i} THEN PRINT("big {i}") ELSE PRINT("small")')
+        elif kind == 2:
+            lines.append(f'FUN f{i}(a, b) -> [a, b, a * b, "{i}"]')
+        else:
+            lines.append(f'FOR k = 0 TO {i % 10} THEN f{i - 1}(k, v{i - 3})')
+
+    return '\n'.join(lines) + '\n'
+
+
+##############################
+# RUNNER
+##############################
+
+
+def time_source(name: str, source: str, repeat: int = 3, use_vm: bool = False, use_python: bool = False) -> float:
+    """Runs a BASIC source repeatedly and returns the best wall time in seconds."""
+    best: float = float('inf')
+
+    for _ in range(repeat):
+        global_symbol_table = create_global_symbol_table()
+        gc.collect()
+
+        start: float = time.perf_counter()
+        _, error = run(f'<{name}>', source, global_symbol_table, use_vm, use_python=use_python)
+        elapsed: float = time.perf_counter() - start
+
+        if error:
+            raise Exception(f'Benchmark "{name}" failed:\n{error.as_string()}')
+
+        best = min(best, elapsed)
+
+    return best
+
+
+def count_nodes(node) -> int:
+    """Counts the AST nodes reachable from a node (tokens and positions excluded)."""
+    count: int = 0
+    pending: list = [node]
+
+    while pending:
+        item = pending.pop()
+
+        if isinstance(item, (list, tuple)):
+            pending.extend(item)
+        elif hasattr(item, '__slots__') and not isinstance(item, (Token, Position, SourceText)):
+            count += 1
+            pending.extend(getattr(item, name) for name in item.__slots__ if hasattr(item, name))
+
+    return count
+
+
+def time_lexer(line_counts: tuple = (5000, 10000, 20000, 40000), repeat: int = 3) -> list:
+    """Times the lexer on growing generated scripts, so its scaling can be checked."""
+    results: list = list()
+
+    for line_count in line_counts:
+        source: str = generate_script(line_count)
+        best: float = float('inf')
+
+        for _ in range(repeat):
+            start: float = time.perf_counter()
+            tokens, error = Lexer('<lexer>', source).make_tokens()
+            best = min(best, time.perf_counter() - start)
+
+        if error:
+            raise Exception('Lexer benchmark script failed to lex.')
+
+        results.append({
+            'lines': line_count,
+            'tokens': len(tokens),
+            'seconds': best,
+            'tokens_per_second': len(tokens) / best,
+        })
+
+    return results
+
+
+def measure_memory(line_count: int = 20000) -> dict:
+    """Measures the memory held by the tokens and the AST of a generated script."""
+    source: str = generate_script(line_count)
+
+    tracemalloc.start()
+    before_lex: int = tracemalloc.get_traced_memory()[0]
+    tokens, error = Lexer('<memory>', source).make_tokens()
+    after_lex: int = tracemalloc.get_traced_memory()[0]
+    ast = Parser(tokens).parse()
+    after_parse: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    if error or ast.error:
+        raise Exception('Memory benchmark script failed to parse.')
+
+    node_count: int = count_nodes(ast.node)
+
+    return {
+        'lines': line_count,
+        'tokens': len(tokens),
+        'nodes': node_count,
+        'bytes_per_token': (after_lex - before_lex) / len(tokens),
+        'bytes_per_node': (after_parse - after_lex) / node_count,
+    }
+
+
+def measure_parse_memory(line_counts: tuple = PARSE_MEMORY_LINE_COUNTS) -> list:
+    """Measures the peak memory of parsing generated scripts, beyond the AST that is kept."""
+    results: list = list()
+
+    for line_count in line_counts:
+        source: str = generate_script(line_count)
+
+        tracemalloc.start()
+        before: int = tracemalloc.get_traced_memory()[0]
+        node, error = parse('<parse memory>', source)
+        after, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if error:
+            raise Exception('Parse memory benchmark script failed to parse.')
+
+        results.append({'lines': line_count, 'ast_bytes': after - before, 'transient_bytes': peak - after})
+
+    return results
+
+
+def measure_allocations(source: str = ALLOCATION_LOOPS, iterations: int = ALLOCATION_ITERATIONS) -> dict:
+    """Counts the memory blocks a BASIC program leaves allocated, using tracemalloc."""
+    global_symbol_table = create_global_symbol_table()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    _, error = run('<allocations>', source, global_symbol_table)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    if error:
+        raise Exception(f'Allocation benchmark failed:\n{error.as_string()}')
+
+    blocks: int = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    size: int = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+    return {
+        'iterations': iterations,
+        'blocks': blocks,
+        'bytes': size,
+        'blocks_per_iteration': blocks / iterations,
+        'bytes_per_iteration': size / iterations,
+    }
+
+
+def measure_loop_memory(counts: tuple = LOOP_MEMORY_COUNTS, use_vm: bool = False) -> list:
+    """Measures the peak memory of statement loops as their iteration count grows."""
+    results: list = list()
+
+    for count in counts:
+        global_symbol_table = create_global_symbol_table()
+
+        tracemalloc.start()
+        start: float = time.perf_counter()
+        _, error = run('<loop memory>', STATEMENT_LOOPS.format(count=count), global_symbol_table, use_vm)
+        elapsed: float = time.perf_counter() - start
+        peak: int = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        if error:
+            raise Exception(f'Loop memory benchmark failed:\n{error.as_string()}')
+
+        results.append({'iterations': count, 'peak_bytes': peak, 'seconds': elapsed})
+
+    return results
+
+
+def time_parse(line_count: int = PARSE_LINE_COUNT, repeat: int = 3) -> dict:
+    """Times lexing and parsing a generated script, returning the best of each in seconds."""
+    source: str = generate_script(line_count)
+    best_lex: float = float('inf')
+    best_parse: float = float('inf')
+
+    for _ in range(repeat):
+        gc.collect()
+
+        start: float = time.perf_counter()
+        tokens, error = Lexer('<parse>', source).make_tokens()
+        lexed: float = time.perf_counter()
+        ast = Parser(tokens).parse()
+        parsed: float = time.perf_counter()
+
+        if error or ast.error:
+            raise Exception('Parse benchmark script failed to parse.')
+
+        best_lex = min(best_lex, lexed - start)
+        best_parse = min(best_parse, parsed - lexed)
+
+    return {'lex': best_lex, 'parse': best_parse}
+
+
+##############################
+# SUITE
+##############################
+
+
+def run_suite(names: list, use_vm: bool = False, repeat: int = 3, use_python: bool = False) -> dict:
+    """Runs the named benchmarks (and the lex/parse timings) and returns their times in seconds."""
+    results: dict = dict()
+
+    for name in names:
+        if name in BENCHMARKS:
+            results[name] = time_source(name, BENCHMARKS[name], repeat, use_vm, use_python)
+
+    if PARSE_BENCHMARK_NAMES[0] in names or PARSE_BENCHMARK_NAMES[1] in names:
+        times: dict = time_parse(repeat=repeat)
+        results[PARSE_BENCHMARK_NAMES[0]] = times['lex']
+        results[PARSE_BENCHMARK_NAMES[1]] = times['parse']
+
+    return results
+
+
+def suite_report(results: dict, use_vm: bool, use_python: bool = False) -> dict:
+    """Wraps suite results with what is needed to tell two runs apart."""
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'vm': use_vm,
+        'compile': use_python,
+        'results': results,
+    }
+
+
+def compare_results(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns (name, seconds, baseline seconds, ratio, regressed) for every result also in the baseline."""
+    comparisons: list = list()
+
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+
+        ratio: float = seconds / baseline[name]
+        comparisons.append((name, seconds, baseline[name], ratio, ratio > 1 + threshold))
+
+    return comparisons
+
+
+def take_option(args: list, option: str):
+    """Removes `option <value>` from args, returning the value (or None when it is absent)."""
+    if option not in args:
+        return None
+
+    index: int = args.index(option)
+    value: str = args[index + 1]
+    del args[index:index + 2]
+    return value
+
+
+def main(args: list):
+    args = list(args)
+    json_path: str = take_option(args, '--json')
+    baseline_path: str = take_option(args, '--compare')
+    threshold: float = float(take_option(args, '--threshold') or REGRESSION_THRESHOLD)
+    repeat: int = int(take_option(args, '--repeat') or 3)
+
+    use_vm: bool = '--vm' in args
+    use_python: bool = '--compile' in args
+    positional: list = [arg for arg in args if not arg.startswith('--')]
+    names: list = positional or list(BENCHMARKS) + list(PARSE_BENCHMARK_NAMES)
+
+    if '--lex' in args:
+        for result in time_lexer():
+            print(f'{result["lines"]} lines, {result["tokens"]} tokens: {result["seconds"]:.4f}s '
+                  f'({result["tokens_per_second"]:.0f} tokens/s)')
+        return
+
+    if '--allocations' in args:
+        result: dict = measure_allocations()
+        print(f'{result["iterations"]} iterations, {result["blocks"]} blocks, {result["bytes"]} bytes')
+        print(f'blocks per iteration: {result["blocks_per_iteration"]:.2f}')
+        print(f'bytes per iteration: {result["bytes_per_iteration"]:.1f}')
+        return
+
+    if '--loop-memory' in args:
+        counts: tuple = tuple(int(arg) for arg in positional) or LOOP_MEMORY_COUNTS
+
+        for result in measure_loop_memory(counts, use_vm):
+            print(f'{result["iterations"]} iterations: peak {result["peak_bytes"] / 1024:.1f} KiB '
+                  f'({result["seconds"]:.2f}s)')
+        return
+
+    if '--parse-memory' in args:
+        counts: tuple = tuple(int(arg) for arg in positional) or PARSE_MEMORY_LINE_COUNTS
+
+        for result in measure_parse_memory(counts):
+            print(f'{result["lines"]} lines: AST {result["ast_bytes"] / 1024:.0f} KiB, '
+                  f'transient peak {result["transient_bytes"] / 1024:.1f} KiB')
+        return
+
+    if '--memory' in args:
+        result: dict = measure_memory()
+        print(f'{result["lines"]} lines, {result["tokens"]} tokens, {result["nodes"]} nodes')
+        print(f'bytes per token: {result["bytes_per_token"]:.1f}')
+        print(f'bytes per node: {result["bytes_per_node"]:.1f}')
+        return
+
+    results: dict = run_suite(names, use_vm, repeat, use_python)
+
+    for name, seconds in results.items():
+        print(f'{name}: {seconds:.4f}s')
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(suite_report(results, use_vm, use_python), f, indent=4)
+
+    if baseline_path:
+        with open(baseline_path, 'r') as f:
+            baseline: dict = json.load(f)['results']
+
+        regressions: int = 0
+        print(f'\nCompared with {baseline_path} (threshold {threshold:.0%}):')
+
+        for name, seconds, baseline_seconds, ratio, regressed in compare_results(results, baseline, threshold):
+            flag: str = '  REGRESSION' if regressed else ''
+            print(f'{name}: {baseline_seconds:.4f}s -> {seconds:.4f}s ({ratio:.2f}x){flag}')
+            regressions += regressed
+
+        if regressions:
+            print(f'{regressions} benchmark(s) regressed by more than {threshold:.0%}.')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
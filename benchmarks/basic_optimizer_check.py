@@ -0,0 +1,281 @@
+##############################
+# IMPORTS
+##############################
+
+
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.basic_lang_module import create_global_symbol_table, parse, run, Optimizer
+
+
+##############################
+# CORPUS
+##############################
+
+
+# Each program is run with the optimizer on and off, and everything it prints,
+# returns and reports as an error has to be the same both ways.
+
+LITERAL_ARITHMETIC = '''
+PRINT(1 + 2 * 3)
+PRINT((10 - 4) / 3 ^ 2)
+PRINT(7 / 2)
+PRINT(0.1 + 0.2)
+PRINT(-(-5) + -2.5)
+PRINT(2 ^ 10 - 2 ^ -1)
+PRINT(NOT 0)
+PRINT(NOT 1 + 1)
+PRINT(1 == 1 AND 2 < 3 OR 0)
+PRINT(3 >= 3 AND 4 != 4)
+VAR total = 0
+FOR i = 0 TO 10 THEN
+    VAR total = total + i * (60 * 60) - 24 / 4
+END
+PRINT(total)
+(1 + 2) * 3
+'''
+
+STRING_FOLDING = '''
+PRINT("ab" + "cd")
+PRINT("ab" * 3)
+PRINT("-" * 0)
+PRINT(-"ab")
+VAR greeting = "Hello, " + "World" + "!"
+PRINT(greeting)
+"x" * 4 + "y"
+PRINT("a" + "b" == "ab")
+'''
+
+DIVISION_BY_ZERO = '''
+PRINT("before")
+VAR x = 1 + 1 / (2 - 2)
+PRINT("after")
+'''
+
+DIVISION_BY_ZERO_IN_FUNCTION = '''
+FUN broken(a) -> a + 10 / (5 - 5)
+PRINT("defined")
+broken(1)
+'''
+
+ILLEGAL_OPERATIONS = '''
+PRINT("start")
+VAR y = "text" - 1
+'''
+
+LARGE_POWERS = '''
+VAR big = 2 ^ 200
+PRINT(big > 2 ^ 199)
+PRINT(1 ^ 100000)
+PRINT(0 ^ 100000)
+PRINT((-1) ^ 100001)
+VAR medium = (10 ^ 64) ^ 8
+PRINT(medium > 10 ^ 511)
+VAR unused = IF FALSE THEN 9 ^ 9 ^ 9 ELSE 1
+PRINT(unused)
+IF 0 THEN 7 ^ 123456789
+IF 0 THEN (((10 ^ 64) ^ 64) ^ 64) ^ 64
+FOR i = 0 TO 0 THEN (10 ^ 64) ^ 64 ^ 64
+'''
+
+LARGE_STRING_REPEATS = '''
+VAR long = "ab" * 10000
+PRINT(LEN(long))
+PRINT(LEN("x" * 4096 + "y"))
+PRINT(LEN("ab" * 2049))
+IF 0 THEN "z" * 1000000000
+IF 0 THEN "ab" * 50000000
+WHILE 0 THEN "ab" * 50000000
+'''
+
+IF_PRUNING = '''
+PRINT(IF 1 THEN "first" ELSE "else")
+PRINT(IF 0 THEN "first" ELIF 1 THEN "second" ELSE "else")
+PRINT(IF 0 THEN "first" ELIF 0 THEN "second" ELSE "else")
+PRINT(IF 0 THEN "first" ELIF 0 THEN "second")
+PRINT(IF 1 - 1 THEN "zero" ELIF "" THEN "empty" ELIF 2 * 3 THEN "six")
+VAR n = 5
+PRINT(IF n > 3 THEN "big" ELIF 1 THEN "always" ELSE "never")
+PRINT(IF n > 9 THEN "big" ELIF 0 THEN "never" ELSE "small")
+IF 0 THEN
+    PRINT("block never")
+ELIF 1 THEN
+    PRINT("block elif")
+ELSE
+    PRINT("block else")
+END
+IF 1 THEN
+    PRINT("block then")
+END
+IF 0 THEN
+    PRINT("no block")
+END
+IF 0 THEN 1 / 0 ELSE 2
+'''
+
+DEAD_LOOPS = '''
+PRINT(FOR i = 10 TO 0 THEN i)
+PRINT(FOR i = 0 TO 0 THEN i)
+PRINT(FOR i = 0 TO 3 STEP -1 THEN i)
+PRINT(FOR i = 3 TO 0 STEP -1 THEN i)
+PRINT(FOR i = 1 + 1 TO 2 * 1 THEN i)
+PRINT(WHILE 0 THEN 1)
+PRINT(WHILE 1 - 1 THEN 1 / 0)
+PRINT(WHILE "" THEN 1)
+VAR empty = FOR i = 5 TO 5 THEN i * 2
+PRINT(LEN(empty))
+FOR j = 5 TO 0 THEN j
+PRINT(j)
+'''
+
+BLOCK_LOOPS = '''
+VAR a = FOR i = 5 TO 0 THEN
+    PRINT("never")
+END
+PRINT(a)
+VAR b = WHILE 0 THEN
+    PRINT("never")
+END
+PRINT(b)
+VAR c = FOR i = 0 TO 3 THEN
+    PRINT(i * 10 + 1)
+END
+PRINT(c)
+VAR count = 0
+WHILE count < 3 THEN
+    VAR count = count + 1
+END
+PRINT(count)
+FOR i = 0 TO 0 THEN
+    PRINT("never")
+END
+'''
+
+FUNCTIONS = '''
+FUN scale(x) -> x * (2 + 3)
+FUN label(x)
+    IF 1 THEN RETURN "label " + "of " + x
+    RETURN "unreachable"
+END
+FUN count_down(n) -> IF n == 0 THEN 0 + 0 ELSE count_down(n - (3 - 2))
+PRINT(scale(4))
+PRINT(label("x"))
+PRINT(count_down(50))
+PRINT(MAP([1, 2, 3], FUN (x) -> x * (1 + 1)))
+scale(1 + 1)
+'''
+
+CORPUS: dict = {
+    'literal_arithmetic': LITERAL_ARITHMETIC,
+    'string_folding': STRING_FOLDING,
+    'division_by_zero': DIVISION_BY_ZERO,
+    'division_by_zero_in_function': DIVISION_BY_ZERO_IN_FUNCTION,
+    'illegal_operations': ILLEGAL_OPERATIONS,
+    'large_powers': LARGE_POWERS,
+    'large_string_repeats': LARGE_STRING_REPEATS,
+    'if_pruning': IF_PRUNING,
+    'dead_loops': DEAD_LOOPS,
+    'block_loops': BLOCK_LOOPS,
+    'functions': FUNCTIONS,
+}
+
+# Optimizing any program in the corpus must stay within these limits: sizes
+# are estimated before anything is folded, and dead branches are not folded
+# at all.
+OPTIMIZE_TIME_LIMIT: float = 1.0
+OPTIMIZE_MEMORY_LIMIT: int = 1024 * 1024
+
+# Every way a program can be run, as the (use_vm, use_python) passed to run.
+BACKENDS: dict = {
+    'interpreter': (False, False),
+    'vm': (True, False),
+    'compile': (False, True),
+}
+
+
+##############################
+# RUNNER
+##############################
+
+
+def run_program(name: str, source: str, use_vm: bool, use_python: bool, optimize: bool) -> tuple:
+    """Runs a BASIC program and returns what it printed, its value and its error text."""
+    global_symbol_table = create_global_symbol_table()
+    output = io.StringIO()
+
+    with contextlib.redirect_stdout(output):
+        value, error = run(f'<{name}>', source, global_symbol_table, use_vm, optimize, use_python)
+
+    return output.getvalue(), repr(value), error.as_string() if error else None
+
+
+def check_program(name: str, source: str, use_vm: bool, use_python: bool) -> list:
+    """Returns a description of every difference between the optimized and unoptimized runs."""
+    optimized: tuple = run_program(name, source, use_vm, use_python, True)
+    unoptimized: tuple = run_program(name, source, use_vm, use_python, False)
+    differences: list = list()
+
+    for label, with_pass, without_pass in zip(('output', 'value', 'error'), optimized, unoptimized):
+        if with_pass != without_pass:
+            differences.append(f'{label} differs\n  optimized:   {with_pass!r}\n  unoptimized: {without_pass!r}')
+
+    return differences
+
+
+def measure_optimizer(name: str, source: str) -> tuple:
+    """Returns the seconds and the peak bytes the optimizer takes on a BASIC program."""
+    node, error = parse(f'<{name}>', source)
+
+    if error:
+        raise Exception(f'Program "{name}" failed to parse:\n{error.as_string()}')
+
+    tracemalloc.start()
+    start: float = time.perf_counter()
+    Optimizer().optimize(node)
+    elapsed: float = time.perf_counter() - start
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main(args: list):
+    names: list = [arg for arg in args if not arg.startswith('--')] or list(CORPUS)
+    backends: list = [name for name in BACKENDS if f'--{name}' in args] or list(BACKENDS)
+    mismatches: int = 0
+
+    for name in names:
+        seconds, peak = measure_optimizer(name, CORPUS[name])
+
+        if seconds > OPTIMIZE_TIME_LIMIT or peak > OPTIMIZE_MEMORY_LIMIT:
+            print(f'{name}: optimizing took {seconds:.2f}s and peaked at {peak / 1024:.0f} KiB '
+                  f'(limits {OPTIMIZE_TIME_LIMIT:.2f}s, {OPTIMIZE_MEMORY_LIMIT / 1024:.0f} KiB)')
+            mismatches += 1
+
+        for backend in backends:
+            use_vm, use_python = BACKENDS[backend]
+            differences: list = check_program(name, CORPUS[name], use_vm, use_python)
+
+            print(f'{name} ({backend}): {"MISMATCH" if differences else "ok"}')
+
+            for difference in differences:
+                print(f'  {difference}')
+
+            mismatches += len(differences) > 0
+
+    if mismatches:
+        print(f'{mismatches} program run(s) differ with the optimizer on and off, or exceed its limits.')
+        sys.exit(1)
+
+    print(f'All {len(names) * len(backends)} program runs match with the optimizer on and off.')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -8,8 +8,20 @@
 #######################################
 
 import string
+import sys
 import os
+import re
+import bisect
+import array
+import operator
+import itertools
 import math
+import gc
+import time
+import json
+import pickle
+import hashlib
+import collections
 
 from vos_file_system import FileSystem
 
@@ -60,13 +72,25 @@ LETTERS_DIGITS = LETTERS + DIGITS
 #######################################
 
 class Error:
+    # An error only keeps references to its positions and context. Errors
+    # are often made and dropped unread (a failed alternative in the parser,
+    # an operation that is run again to find where it failed), so the
+    # message is put together the first time it is asked for and then kept.
+    __slots__ = ('pos_start', 'pos_end', 'error_name', 'details', 'formatted')
+
     def __init__(self, pos_start, pos_end, error_name, details):
         self.pos_start = pos_start
         self.pos_end = pos_end
         self.error_name = error_name
         self.details = details
+        self.formatted = None
 
     def as_string(self):
+        if self.formatted is None:
+            self.formatted = self.format()
+        return self.formatted
+
+    def format(self):
         result = f'{self.error_name}: {self.details}\n'
         result += f'File {self.pos_start.fn}, line {self.pos_start.ln + 1}'
         result += '\n\n' + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
@@ -74,68 +98,119 @@ class Error:
 
 
 class IllegalCharError(Error):
+    __slots__ = ()
+
     def __init__(self, pos_start, pos_end, details):
         super().__init__(pos_start, pos_end, 'Illegal Character', details)
 
 
 class ExpectedCharError(Error):
+    __slots__ = ()
+
     def __init__(self, pos_start, pos_end, details):
         super().__init__(pos_start, pos_end, 'Expected Character', details)
 
 
 class InvalidSyntaxError(Error):
+    __slots__ = ()
+
     def __init__(self, pos_start, pos_end, details=''):
         super().__init__(pos_start, pos_end, 'Invalid Syntax', details)
 
 
+TRACEBACK_REPEAT_LIMIT = 3
+
+
 class RTError(Error):
+    # Contexts are never changed once made (a tail call makes a new one), so
+    # the traceback can still be read from the context chain when printed.
+    __slots__ = ('context',)
+
     def __init__(self, pos_start, pos_end, details, context):
         super().__init__(pos_start, pos_end, 'Runtime Error', details)
         self.context = context
 
-    def as_string(self):
+    def format(self):
         result = self.generate_traceback()
         result += f'{self.error_name}: {self.details}'
         result += '\n\n' + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
         return result
 
     def generate_traceback(self):
-        result = ''
+        lines = []
         pos = self.pos_start
         ctx = self.context
 
         while ctx:
-            result = f'  File {pos.fn}, line {str(pos.ln + 1)}, in {ctx.display_name}\n' + result
+            lines.append(f'  File {pos.fn}, line {str(pos.ln + 1)}, in {ctx.display_name}\n')
             pos = ctx.parent_entry_pos
             ctx = ctx.parent
 
-        return 'Traceback (most recent call last):\n' + result
+        # Deep recursion repeats the same line many times, so long runs are
+        # cut short the way Python's own tracebacks do.
+        result = []
+        for line, group in itertools.groupby(reversed(lines)):
+            count = sum(1 for _ in group)
+            result.append(line * min(count, TRACEBACK_REPEAT_LIMIT))
+
+            if count > TRACEBACK_REPEAT_LIMIT:
+                result.append(f'  [Previous line repeated {count - TRACEBACK_REPEAT_LIMIT} more times]\n')
+
+        return 'Traceback (most recent call last):\n' + ''.join(result)
 
 
 #######################################
 # POSITION
 #######################################
 
+class SourceText:
+    # The file name and text shared by every position in one source. Line
+    # starts are only worked out the first time a line or column is asked
+    # for, which in practice means when an error is being formatted.
+    __slots__ = ('fn', 'text', 'line_starts')
+
+    def __init__(self, fn, text):
+        self.fn = fn
+        self.text = text
+        self.line_starts = None
+
+    def line_col(self, idx):
+        if self.line_starts is None:
+            self.line_starts = [0] + [match.end() for match in re.finditer('\n', self.text)]
+
+        ln = bisect.bisect_right(self.line_starts, idx) - 1
+        return ln, idx - self.line_starts[ln]
+
+
 class Position:
-    def __init__(self, idx, ln, col, fn, ftxt):
+    # A position is just an offset into its source. Token end positions
+    # (is_end) are reported one column past the token's last character on
+    # that character's line, so a newline token doesn't spill onto the next.
+    __slots__ = ('idx', 'source', 'is_end')
+
+    def __init__(self, idx, source, is_end=False):
         self.idx = idx
-        self.ln = ln
-        self.col = col
-        self.fn = fn
-        self.ftxt = ftxt
+        self.source = source
+        self.is_end = is_end
 
-    def advance(self, current_char=None):
-        self.idx += 1
-        self.col += 1
+    @property
+    def fn(self):
+        return self.source.fn
 
-        if current_char == '\n':
-            self.ln += 1
-            self.col = 0
+    @property
+    def ftxt(self):
+        return self.source.text
 
-        return self
+    @property
+    def ln(self):
+        return self.source.line_col(self.idx - 1 if self.is_end else self.idx)[0]
 
-    def copy(self):
-        return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
+    @property
+    def col(self):
+        if self.is_end:
+            return self.source.line_col(self.idx - 1)[1] + 1
+
+        return self.source.line_col(self.idx)[1]
 
 
 #######################################
@@ -167,6 +242,7 @@ TT_COMMA = 'COMMA'
 TT_ARROW = 'ARROW'
 TT_NEWLINE = 'NEWLINE'
 TT_EOF = 'EOF'
+TT_STOPPED = 'STOPPED'  # Only ever made by Parser.resume.
 
 KEYWORDS = [
     'VAR',
@@ -186,21 +262,20 @@ KEYWORDS = [
     'RETURN',
     'CONTINUE',
     'BREAK',
+    'IMPORT',
 ]
 
 
 class Token:
+    __slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
     def __init__(self, type_, value=None, pos_start=None, pos_end=None):
         self.type = type_
         self.value = value
 
         if pos_start:
-            self.pos_start = pos_start.copy()
-            self.pos_end = pos_start.copy()
-            self.pos_end.advance()
-
-        if pos_end:
-            self.pos_end = pos_end.copy()
+            self.pos_start = pos_start
+            self.pos_end = pos_end or Position(pos_start.idx + 1, pos_start.source, True)
 
     def matches(self, type_, value):
         return self.type == type_ and self.value == value
@@ -214,198 +289,121 @@ class Token:
 # LEXER
 #######################################
 
+# Blanks in front of a token are folded into its match, which halves the
+# number of matches the lexer has to look at.
+TOKEN_REGEX = re.compile(
+    r'[ \t]*(?:'
+    r'(?P<COMMENT>#[^\n]*\n?)'
+    r'|(?P<NEWLINE>[;\n])'
+    rf'|(?P<NUMBER>[{DIGITS}]+(?:\.[{DIGITS}]*)?)'
+    rf'|(?P<NAME>[{LETTERS}][{LETTERS_DIGITS}_]*)'
+    r'|(?P<STRING>"[^"]*"?)'
+    r'|(?P<OP>->|!=|==|<=|>=|[-+*/^()\[\]=<>,])'
+    r'|(?P<NOT>!)'
+    r'|(?P<ILLEGAL>[^ \t]))',
+    re.DOTALL
+)
+
+OPERATOR_TOKENS = {
+    '+': TT_PLUS,
+    '-': TT_MINUS,
+    '*': TT_MUL,
+    '/': TT_DIV,
+    '^': TT_POW,
+    '(': TT_LPAREN,
+    ')': TT_RPAREN,
+    '[': TT_LSQUARE,
+    ']': TT_RSQUARE,
+    '=': TT_EQ,
+    '<': TT_LT,
+    '>': TT_GT,
+    ',': TT_COMMA,
+    '->': TT_ARROW,
+    '!=': TT_NE,
+    '==': TT_EE,
+    '<=': TT_LTE,
+    '>=': TT_GTE,
+}
+
+KEYWORD_SET = frozenset(KEYWORDS)
+
+
 class Lexer:
     def __init__(self, fn, text):
         self.fn = fn
         self.text = text
-        self.pos = Position(-1, 0, -1, fn, text)
-        self.current_char = None
-        self.advance()
-
-    def advance(self):
-        self.pos.advance(self.current_char)
-        self.current_char = self.text[self.pos.idx] if self.pos.idx < len(self.text) else None
+        self.source = SourceText(fn, text)
+        self.error = None
 
     def make_tokens(self):
-        tokens = []
-
-        while self.current_char != None:
-            if self.current_char in ' \t':
-                self.advance()
-            elif self.current_char == '#':
-                self.skip_comment()
-            elif self.current_char in ';\n':
-                tokens.append(Token(TT_NEWLINE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char in DIGITS:
-                tokens.append(self.make_number())
-            elif self.current_char in LETTERS:
-                tokens.append(self.make_identifier())
-            elif self.current_char == '"':
-                tokens.append(self.make_string())
-            elif self.current_char == '+':
-                tokens.append(Token(TT_PLUS, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '-':
-                tokens.append(self.make_minus_or_arrow())
-            elif self.current_char == '*':
-                tokens.append(Token(TT_MUL, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '/':
-                tokens.append(Token(TT_DIV, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '^':
-                tokens.append(Token(TT_POW, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '(':
-                tokens.append(Token(TT_LPAREN, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ')':
-                tokens.append(Token(TT_RPAREN, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '[':
-                tokens.append(Token(TT_LSQUARE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ']':
-                tokens.append(Token(TT_RSQUARE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '!':
-                token, error = self.make_not_equals()
-                if error: return [], error
-                tokens.append(token)
-            elif self.current_char == '=':
-                tokens.append(self.make_equals())
-            elif self.current_char == '<':
-                tokens.append(self.make_less_than())
-            elif self.current_char == '>':
-                tokens.append(self.make_greater_than())
-            elif self.current_char == ',':
-                tokens.append(Token(TT_COMMA, pos_start=self.pos))
-                self.advance()
-            else:
-                pos_start = self.pos.copy()
-                char = self.current_char
-                self.advance()
-                return [], IllegalCharError(pos_start, self.pos, "'" + char + "'")
+        # Tokens and positions never form cycles, so there is nothing for the
+        # collector to find while they are being churned out.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
 
-        tokens.append(Token(TT_EOF, pos_start=self.pos))
-        return tokens, None
-
-    def make_number(self):
-        num_str = ''
-        dot_count = 0
-        pos_start = self.pos.copy()
+        try:
+            tokens = list(self.generate_tokens())
+        finally:
+            if gc_was_enabled:
+                gc.enable()
 
-        while self.current_char != None and self.current_char in DIGITS + '.':
-            if self.current_char == '.':
-                if dot_count == 1: break
-                dot_count += 1
-            num_str += self.current_char
-            self.advance()
+        if self.error:
+            return [], self.error
 
-        if dot_count == 0:
-            return Token(TT_INT, int(num_str), pos_start, self.pos)
-        else:
-            return Token(TT_FLOAT, float(num_str), pos_start, self.pos)
+        return tokens, None
 
-    def make_string(self):
-        string = ''
-        pos_start = self.pos.copy()
-        escape_character = False
-        self.advance()
+    def generate_tokens(self):
+        # Yields the tokens one at a time, so a parser pulling from it only
+        # keeps the ones its nodes hold on to. An illegal character ends the
+        # tokens early: self.error is set and the EOF token comes next.
+        source = self.source
+        eof_idx = len(self.text)
+
+        for match in TOKEN_REGEX.finditer(self.text):
+            kind = match.lastgroup
+            text = match.group(kind)
+
+            if kind == 'COMMENT':
+                # A comment also eats its newline, or steps past the end of
+                # the text when there isn't one.
+                if text[-1] != '\n': eof_idx = len(self.text) + 1
+                continue
 
-        escape_characters = {
-            'n': '\n',
-            't': '\t'
-        }
+            start, end = match.span(kind)
 
-        while self.current_char != None and (self.current_char != '"' or escape_character):
-            if escape_character:
-                string += escape_characters.get(self.current_char, self.current_char)
-            else:
-                if self.current_char == '\\':
-                    escape_character = True
+            if kind == 'OP':
+                tok_type, value = OPERATOR_TOKENS[text], None
+            elif kind == 'NAME':
+                tok_type = TT_KEYWORD if text in KEYWORD_SET else TT_IDENTIFIER
+                value = text
+            elif kind == 'NUMBER':
+                if '.' in text:
+                    tok_type, value = TT_FLOAT, float(text)
                 else:
-                    string += self.current_char
-            self.advance()
-            escape_character = False
-
-        self.advance()
-        return Token(TT_STRING, string, pos_start, self.pos)
-
-    def make_identifier(self):
-        id_str = ''
-        pos_start = self.pos.copy()
-
-        while self.current_char != None and self.current_char in LETTERS_DIGITS + '_':
-            id_str += self.current_char
-            self.advance()
-
-        tok_type = TT_KEYWORD if id_str in KEYWORDS else TT_IDENTIFIER
-        return Token(tok_type, id_str, pos_start, self.pos)
-
-    def make_minus_or_arrow(self):
-        tok_type = TT_MINUS
-        pos_start = self.pos.copy()
-        self.advance()
-
-        if self.current_char == '>':
-            self.advance()
-            tok_type = TT_ARROW
-
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
-
-    def make_not_equals(self):
-        pos_start = self.pos.copy()
-        self.advance()
-
-        if self.current_char == '=':
-            self.advance()
-            return Token(TT_NE, pos_start=pos_start, pos_end=self.pos), None
-
-        self.advance()
-        return None, ExpectedCharError(pos_start, self.pos, "'=' (after '!')")
-
-    def make_equals(self):
-        tok_type = TT_EQ
-        pos_start = self.pos.copy()
-        self.advance()
-
-        if self.current_char == '=':
-            self.advance()
-            tok_type = TT_EE
-
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
-
-    def make_less_than(self):
-        tok_type = TT_LT
-        pos_start = self.pos.copy()
-        self.advance()
-
-        if self.current_char == '=':
-            self.advance()
-            tok_type = TT_LTE
-
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
-
-    def make_greater_than(self):
-        tok_type = TT_GT
-        pos_start = self.pos.copy()
-        self.advance()
-
-        if self.current_char == '=':
-            self.advance()
-            tok_type = TT_GTE
-
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
-
-    def skip_comment(self):
-        self.advance()
+                    tok_type, value = TT_INT, int(text)
+            elif kind == 'NEWLINE':
+                tok_type, value = TT_NEWLINE, None
+            elif kind == 'STRING':
+                # A backslash is dropped and never escapes anything, so the
+                # first '"' always closes the string. An unterminated string
+                # runs to the end of the text and ends one past it.
+                if len(text) > 1 and text[-1] == '"':
+                    value = text[1:-1]
+                else:
+                    value = text[1:]
+                    end = eof_idx = len(self.text) + 1
+                tok_type = TT_STRING
+                value = value.replace('\\', '')
+            elif kind == 'NOT':
+                self.error = ExpectedCharError(Position(start, source), Position(start + 2, source), "'=' (after '!')")
+                break
+            else:
+                self.error = IllegalCharError(Position(start, source), Position(end, source), "'" + text + "'")
+                break
 
-        while self.current_char != '\n':
-            self.advance()
+            yield Token(tok_type, value, Position(start, source), Position(end, source, True))
 
-        self.advance()
+        yield Token(TT_EOF, pos_start=Position(eof_idx, source))
 
 
 #######################################
@@ -413,6 +411,8 @@ class Lexer:
 #######################################
 
 class NumberNode:
+    __slots__ = ('tok', 'pos_start', 'pos_end')
+
     def __init__(self, tok):
         self.tok = tok
 
@@ -424,6 +424,8 @@ class NumberNode:
 
 
 class StringNode:
+    __slots__ = ('tok', 'pos_start', 'pos_end')
+
     def __init__(self, tok):
         self.tok = tok
 
@@ -435,6 +437,8 @@ class StringNode:
 
 
 class ListNode:
+    __slots__ = ('element_nodes', 'pos_start', 'pos_end')
+
     def __init__(self, element_nodes, pos_start, pos_end):
         self.element_nodes = element_nodes
 
@@ -443,27 +447,44 @@ class ListNode:
 
 
 class VarAccessNode:
+    __slots__ = ('var_name_tok', 'local_slot', 'global_slot', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok):
         self.var_name_tok = var_name_tok
+        self.local_slot = None
+        self.global_slot = None
 
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.var_name_tok.pos_end
 
 
 class VarAssignNode:
+    __slots__ = ('var_name_tok', 'value_node', 'slot', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok, value_node):
         self.var_name_tok = var_name_tok
         self.value_node = value_node
+        self.slot = None
 
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.value_node.pos_end
 
 
 class BinOpNode:
+    # method_name is the Value method the operator runs. left_type,
+    # right_type and cached_op are the interpreter's inline cache: the
+    # operand types last seen here and the operation specialised for them.
+    __slots__ = ('left_node', 'op_tok', 'right_node', 'method_name', 'left_type', 'right_type', 'cached_op',
+                 'pos_start', 'pos_end')
+
     def __init__(self, left_node, op_tok, right_node):
         self.left_node = left_node
         self.op_tok = op_tok
         self.right_node = right_node
+        self.method_name = BINARY_OP_METHODS[op_tok.value if op_tok.type == TT_KEYWORD else op_tok.type]
+        self.left_type = None
+        self.right_type = None
+        self.cached_op = None
 
         self.pos_start = self.left_node.pos_start
         self.pos_end = self.right_node.pos_end
@@ -473,9 +494,14 @@ class BinOpNode:
 
 
 class UnaryOpNode:
+    # method_name is 'multed_by' (by -1) for '-', 'notted' for NOT, and None
+    # for '+', which leaves its operand as it is.
+    __slots__ = ('op_tok', 'node', 'method_name', 'pos_start', 'pos_end')
+
     def __init__(self, op_tok, node):
         self.op_tok = op_tok
         self.node = node
+        self.method_name = UNARY_OP_METHODS.get(op_tok.value if op_tok.type == TT_KEYWORD else op_tok.type)
 
         self.pos_start = self.op_tok.pos_start
         self.pos_end = node.pos_end
@@ -485,6 +511,8 @@ class UnaryOpNode:
 
 
 class IfNode:
+    __slots__ = ('cases', 'else_case', 'pos_start', 'pos_end')
+
     def __init__(self, cases, else_case):
         self.cases = cases
         self.else_case = else_case
@@ -494,6 +522,9 @@ class IfNode:
 
 
 class ForNode:
+    __slots__ = ('var_name_tok', 'start_value_node', 'end_value_node', 'step_value_node', 'body_node',
+                 'should_return_null', 'var_slot', 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok, start_value_node, end_value_node, step_value_node, body_node, should_return_null):
         self.var_name_tok = var_name_tok
         self.start_value_node = start_value_node
@@ -501,12 +532,15 @@ class ForNode:
         self.step_value_node = step_value_node
         self.body_node = body_node
         self.should_return_null = should_return_null
+        self.var_slot = None
 
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.body_node.pos_end
 
 
 class WhileNode:
+    __slots__ = ('condition_node', 'body_node', 'should_return_null', 'pos_start', 'pos_end')
+
     def __init__(self, condition_node, body_node, should_return_null):
         self.condition_node = condition_node
         self.body_node = body_node
@@ -517,11 +551,16 @@ class WhileNode:
 
 
 class FuncDefNode:
+    __slots__ = ('var_name_tok', 'arg_name_toks', 'body_node', 'should_auto_return', 'slot', 'scope',
+                 'pos_start', 'pos_end')
+
     def __init__(self, var_name_tok, arg_name_toks, body_node, should_auto_return):
         self.var_name_tok = var_name_tok
         self.arg_name_toks = arg_name_toks
         self.body_node = body_node
         self.should_auto_return = should_auto_return
+        self.slot = None
+        self.scope = None
 
         if self.var_name_tok:
             self.pos_start = self.var_name_tok.pos_start
@@ -534,9 +573,12 @@ class FuncDefNode:
 
 
 class CallNode:
+    __slots__ = ('node_to_call', 'arg_nodes', 'is_tail', 'pos_start', 'pos_end')
+
     def __init__(self, node_to_call, arg_nodes):
         self.node_to_call = node_to_call
         self.arg_nodes = arg_nodes
+        self.is_tail = False
 
         self.pos_start = self.node_to_call.pos_start
 
@@ -547,6 +589,8 @@ class CallNode:
 
 
 class ReturnNode:
+    __slots__ = ('node_to_return', 'pos_start', 'pos_end')
+
     def __init__(self, node_to_return, pos_start, pos_end):
         self.node_to_return = node_to_return
 
@@ -555,12 +599,16 @@ class ReturnNode:
 
 
 class ContinueNode:
+    __slots__ = ('pos_start', 'pos_end')
+
     def __init__(self, pos_start, pos_end):
         self.pos_start = pos_start
         self.pos_end = pos_end
 
 
 class BreakNode:
+    __slots__ = ('pos_start', 'pos_end')
+
     def __init__(self, pos_start, pos_end):
         self.pos_start = pos_start
         self.pos_end = pos_end
@@ -576,7 +624,6 @@ class ParseResult:
         self.node = None
         self.last_registered_advance_count = 0
         self.advance_count = 0
-        self.to_reverse_count = 0
 
     def register_advancement(self):
         self.last_registered_advance_count = 1
@@ -588,12 +635,6 @@ class ParseResult:
         if res.error: self.error = res.error
         return res.node
 
-    def try_register(self, res):
-        if res.error:
-            self.to_reverse_count = res.advance_count
-            return None
-        return self.register(res)
-
     def success(self, node):
         self.node = node
         return self
@@ -608,28 +649,87 @@ class ParseResult:
 # PARSER
 #######################################
 
+# The parser decides what comes next from the current token alone and never
+# steps back, so a statement (or the value of a RETURN) is only started on a
+# token that can begin one.
+EXPR_START_TYPES = frozenset((TT_INT, TT_FLOAT, TT_STRING, TT_IDENTIFIER, TT_PLUS, TT_MINUS, TT_LPAREN, TT_LSQUARE))
+EXPR_START_KEYWORDS = frozenset(('VAR', 'NOT', 'IF', 'FOR', 'WHILE', 'FUN'))
+STATEMENT_START_KEYWORDS = EXPR_START_KEYWORDS | {'RETURN', 'CONTINUE', 'BREAK', 'IMPORT'}
+
+# How tightly each binary operator binds, keyed like BINARY_OP_METHODS.
+# Operators of one level are left-associative. '^' is parsed by power, and
+# NOT binds like a comparison operand.
+BINARY_PRECEDENCE = {
+    'AND': 1,
+    'OR': 1,
+    TT_EE: 2,
+    TT_NE: 2,
+    TT_LT: 2,
+    TT_GT: 2,
+    TT_LTE: 2,
+    TT_GTE: 2,
+    TT_PLUS: 3,
+    TT_MINUS: 3,
+    TT_MUL: 4,
+    TT_DIV: 4,
+}
+COMPARISON_PRECEDENCE = 2
+
+
 class Parser:
+    # Tokens can be a list or any iterator over them, such as
+    # Lexer.generate_tokens(). They are read once, in order, and only the
+    # current one is kept (stream_tok, which is also current_tok unless the
+    # parser has stopped at an earlier token).
     def __init__(self, tokens):
-        self.tokens = tokens
-        self.tok_idx = -1
+        self.tokens = iter(tokens)
+        self.stream_tok = None
+        self.stop_error = None
+        self.lost_error = None
         self.advance()
 
     def advance(self):
-        self.tok_idx += 1
-        self.update_current_tok()
+        if self.stop_error:
+            return self.resume()
+
+        self.current_tok = self.stream_tok = next(self.tokens, self.stream_tok)
         return self.current_tok
 
-    def reverse(self, amount=1):
-        self.tok_idx -= amount
-        self.update_current_tok()
+    def stop_at(self, tok, error):
+        # Ends the statements at tok, the first token of a statement (or of
+        # a RETURN value) that failed to parse. Its tokens are not read
+        # again: tok is just put back as the current token, so whatever
+        # comes next reports its error there, as if the statement had never
+        # been started.
+        self.stop_error = error
+        self.lost_error = None
+        self.current_tok = tok
+
+    def resume(self):
+        # Reading on from a stopped-at token would mean parsing the failed
+        # statement's tokens again. Instead, whatever is being parsed fails
+        # there, as it nearly always would: the current token becomes one
+        # that nothing accepts, up to the next statement that is stopped at.
+        # If the parse fails without reaching one, the failed statement's
+        # own error is reported.
+        self.lost_error = self.stop_error
+        self.stop_error = None
+        tok = self.stream_tok
+        self.current_tok = Token(TT_STOPPED, pos_start=tok.pos_start, pos_end=tok.pos_end)
         return self.current_tok
 
-    def update_current_tok(self):
-        if self.tok_idx >= 0 and self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+    def starts_expr(self):
+        tok = self.current_tok
+        return tok.type in EXPR_START_TYPES or (tok.type == TT_KEYWORD and tok.value in EXPR_START_KEYWORDS)
+
+    def starts_statement(self):
+        tok = self.current_tok
+        return tok.type in EXPR_START_TYPES or (tok.type == TT_KEYWORD and tok.value in STATEMENT_START_KEYWORDS)
 
     def parse(self):
         res = self.statements()
+        if self.lost_error:
+            return ParseResult().failure(self.lost_error)
         if not res.error and self.current_tok.type != TT_EOF:
             return res.failure(InvalidSyntaxError(
                 self.current_tok.pos_start, self.current_tok.pos_end,
@@ -642,7 +742,7 @@ class Parser:
     def statements(self):
         res = ParseResult()
         statements = []
-        pos_start = self.current_tok.pos_start.copy()
+        pos_start = self.current_tok.pos_start
 
         while self.current_tok.type == TT_NEWLINE:
             res.register_advancement()
@@ -652,59 +752,74 @@ class Parser:
         if res.error: return res
         statements.append(statement)
 
-        more_statements = True
-
-        while True:
-            newline_count = 0
+        while self.current_tok.type == TT_NEWLINE:
             while self.current_tok.type == TT_NEWLINE:
                 res.register_advancement()
                 self.advance()
-                newline_count += 1
-            if newline_count == 0:
-                more_statements = False
-
-            if not more_statements: break
-            statement = res.try_register(self.statement())
-            if not statement:
-                self.reverse(res.to_reverse_count)
-                more_statements = False
-                continue
-            statements.append(statement)
+
+            if not self.starts_statement():
+                break
+
+            tok = self.current_tok
+            statement_res = self.statement()
+            if statement_res.error:
+                self.stop_at(tok, statement_res.error)
+                break
+
+            statements.append(res.register(statement_res))
 
         return res.success(ListNode(
             statements,
             pos_start,
-            self.current_tok.pos_end.copy()
+            self.current_tok.pos_end
         ))
 
     def statement(self):
         res = ParseResult()
-        pos_start = self.current_tok.pos_start.copy()
+        pos_start = self.current_tok.pos_start
 
         if self.current_tok.matches(TT_KEYWORD, 'RETURN'):
             res.register_advancement()
             self.advance()
 
-            expr = res.try_register(self.expr())
-            if not expr:
-                self.reverse(res.to_reverse_count)
-            return res.success(ReturnNode(expr, pos_start, self.current_tok.pos_start.copy()))
+            expr = None
+            if self.starts_expr():
+                tok = self.current_tok
+                expr_res = self.expr()
+
+                if expr_res.error:
+                    self.stop_at(tok, expr_res.error)
+                else:
+                    expr = res.register(expr_res)
+
+            return res.success(ReturnNode(expr, pos_start, self.current_tok.pos_start))
 
         if self.current_tok.matches(TT_KEYWORD, 'CONTINUE'):
             res.register_advancement()
             self.advance()
-            return res.success(ContinueNode(pos_start, self.current_tok.pos_start.copy()))
+            return res.success(ContinueNode(pos_start, self.current_tok.pos_start))
 
         if self.current_tok.matches(TT_KEYWORD, 'BREAK'):
             res.register_advancement()
             self.advance()
-            return res.success(BreakNode(pos_start, self.current_tok.pos_start.copy()))
+            return res.success(BreakNode(pos_start, self.current_tok.pos_start))
+
+        if self.current_tok.matches(TT_KEYWORD, 'IMPORT'):
+            # IMPORT <expr> is a call to the IMPORT built-in. The name is a
+            # keyword, so no program can rebind it.
+            import_tok = Token(TT_IDENTIFIER, 'IMPORT', self.current_tok.pos_start, self.current_tok.pos_end)
+            res.register_advancement()
+            self.advance()
+
+            path = res.register(self.expr())
+            if res.error: return res
+            return res.success(CallNode(VarAccessNode(import_tok), [path]))
 
         expr = res.register(self.expr())
         if res.error:
             return res.failure(InvalidSyntaxError(
                 self.current_tok.pos_start, self.current_tok.pos_end,
-                "Expected 'RETURN', 'CONTINUE', 'BREAK', 'VAR', 'IF', 'FOR', 'WHILE', 'FUN', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
+                "Expected 'RETURN', 'CONTINUE', 'BREAK', 'IMPORT', 'VAR', 'IF', 'FOR', 'WHILE', 'FUN', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
             ))
         return res.success(expr)
 
@@ -737,7 +852,7 @@ class Parser:
             if res.error: return res
             return res.success(VarAssignNode(var_name, expr))
 
-        node = res.register(self.bin_op(self.comp_expr, ((TT_KEYWORD, 'AND'), (TT_KEYWORD, 'OR'))))
+        node = res.register(self.binary_op(1))
 
         if res.error:
             return res.failure(InvalidSyntaxError(
@@ -747,33 +862,43 @@ class Parser:
 
         return res.success(node)
 
-    def comp_expr(self):
+    def binary_op(self, precedence):
+        # Parses operands joined by operators that bind at least as tightly
+        # as precedence, each right operand by a call one level tighter. At
+        # comparison level and below an operand may start with NOT.
         res = ParseResult()
 
-        if self.current_tok.matches(TT_KEYWORD, 'NOT'):
+        if precedence <= COMPARISON_PRECEDENCE and self.current_tok.matches(TT_KEYWORD, 'NOT'):
             op_tok = self.current_tok
             res.register_advancement()
             self.advance()
 
-            node = res.register(self.comp_expr())
+            node = res.register(self.binary_op(COMPARISON_PRECEDENCE))
             if res.error: return res
-            return res.success(UnaryOpNode(op_tok, node))
-
-        node = res.register(self.bin_op(self.arith_expr, (TT_EE, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE)))
+            left = UnaryOpNode(op_tok, node)
+        else:
+            left = res.register(self.factor())
 
-        if res.error:
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                "Expected int, float, identifier, '+', '-', '(', '[', 'IF', 'FOR', 'WHILE', 'FUN' or 'NOT'"
-            ))
+            if res.error:
+                if precedence > COMPARISON_PRECEDENCE: return res
+                return res.failure(InvalidSyntaxError(
+                    self.current_tok.pos_start, self.current_tok.pos_end,
+                    "Expected int, float, identifier, '+', '-', '(', '[', 'IF', 'FOR', 'WHILE', 'FUN' or 'NOT'"
+                ))
 
-        return res.success(node)
+        while True:
+            op_tok = self.current_tok
+            op_precedence = BINARY_PRECEDENCE.get(op_tok.value if op_tok.type == TT_KEYWORD else op_tok.type)
+            if op_precedence is None or op_precedence < precedence:
+                break
 
-    def arith_expr(self):
-        return self.bin_op(self.term, (TT_PLUS, TT_MINUS))
+            res.register_advancement()
+            self.advance()
+            right = res.register(self.binary_op(op_precedence + 1))
+            if res.error: return res
+            left = BinOpNode(left, op_tok, right)
 
-    def term(self):
-        return self.bin_op(self.factor, (TT_MUL, TT_DIV))
+        return res.success(left)
 
     def factor(self):
         res = ParseResult()
@@ -789,7 +914,19 @@ class Parser:
         return self.power()
 
     def power(self):
-        return self.bin_op(self.call, (TT_POW,), self.factor)
+        res = ParseResult()
+        left = res.register(self.call())
+        if res.error: return res
+
+        while self.current_tok.type == TT_POW:
+            op_tok = self.current_tok
+            res.register_advancement()
+            self.advance()
+            right = res.register(self.factor())
+            if res.error: return res
+            left = BinOpNode(left, op_tok, right)
+
+        return res.success(left)
 
     def call(self):
         res = ParseResult()
@@ -865,45 +1002,30 @@ class Parser:
                 ))
 
         elif tok.type == TT_LSQUARE:
-            list_expr = res.register(self.list_expr())
-            if res.error: return res
-            return res.success(list_expr)
-
-        elif tok.matches(TT_KEYWORD, 'IF'):
-            if_expr = res.register(self.if_expr())
-            if res.error: return res
-            return res.success(if_expr)
-
-        elif tok.matches(TT_KEYWORD, 'FOR'):
-            for_expr = res.register(self.for_expr())
-            if res.error: return res
-            return res.success(for_expr)
-
-        elif tok.matches(TT_KEYWORD, 'WHILE'):
-            while_expr = res.register(self.while_expr())
-            if res.error: return res
-            return res.success(while_expr)
-
-        elif tok.matches(TT_KEYWORD, 'FUN'):
-            func_def = res.register(self.func_def())
-            if res.error: return res
-            return res.success(func_def)
+            return self.list_expr()
+
+        elif tok.type == TT_KEYWORD:
+            if tok.value == 'IF':
+                return self.if_expr()
+            elif tok.value == 'FOR':
+                return self.for_expr()
+            elif tok.value == 'WHILE':
+                return self.while_expr()
+            elif tok.value == 'FUN':
+                return self.func_def()
 
         return res.failure(InvalidSyntaxError(
             tok.pos_start, tok.pos_end,
             "Expected int, float, identifier, '+', '-', '(', '[', IF', 'FOR', 'WHILE', 'FUN'"
         ))
 
+    # list_expr, if_expr, for_expr, while_expr and func_def start on the
+    # token atom chose them by, which they step past without checking again.
+
     def list_expr(self):
         res = ParseResult()
         element_nodes = []
-        pos_start = self.current_tok.pos_start.copy()
-
-        if self.current_tok.type != TT_LSQUARE:
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected '['"
-            ))
+        pos_start = self.current_tok.pos_start
 
         res.register_advancement()
         self.advance()
@@ -938,22 +1060,53 @@ class Parser:
         return res.success(ListNode(
             element_nodes,
             pos_start,
-            self.current_tok.pos_end.copy()
+            self.current_tok.pos_end
         ))
 
     def if_expr(self):
+        # The IF case and each ELIF case are read in turn. A multi-line case
+        # either ends the expression with END or goes on to an ELIF or ELSE,
+        # and a single-line case may always be followed by one.
         res = ParseResult()
-        all_cases = res.register(self.if_expr_cases('IF'))
-        if res.error: return res
-        cases, else_case = all_cases
-        return res.success(IfNode(cases, else_case))
+        cases = []
+        else_case = None
 
-    def if_expr_b(self):
-        return self.if_expr_cases('ELIF')
+        while True:
+            res.register_advancement()
+            self.advance()
 
-    def if_expr_c(self):
-        res = ParseResult()
-        else_case = None
+            condition = res.register(self.expr())
+            if res.error: return res
+
+            if not self.current_tok.matches(TT_KEYWORD, 'THEN'):
+                return res.failure(InvalidSyntaxError(
+                    self.current_tok.pos_start, self.current_tok.pos_end,
+                    f"Expected 'THEN'"
+                ))
+
+            res.register_advancement()
+            self.advance()
+
+            if self.current_tok.type == TT_NEWLINE:
+                res.register_advancement()
+                self.advance()
+
+                statements = res.register(self.statements())
+                if res.error: return res
+                self.discard_value(statements)
+                cases.append((condition, statements, True))
+
+                if self.current_tok.matches(TT_KEYWORD, 'END'):
+                    res.register_advancement()
+                    self.advance()
+                    return res.success(IfNode(cases, else_case))
+            else:
+                expr = res.register(self.statement())
+                if res.error: return res
+                cases.append((condition, expr, False))
+
+            if not self.current_tok.matches(TT_KEYWORD, 'ELIF'):
+                break
 
         if self.current_tok.matches(TT_KEYWORD, 'ELSE'):
             res.register_advancement()
@@ -965,6 +1118,7 @@ class Parser:
 
                 statements = res.register(self.statements())
                 if res.error: return res
+                self.discard_value(statements)
                 else_case = (statements, True)
 
                 if self.current_tok.matches(TT_KEYWORD, 'END'):
@@ -980,127 +1134,52 @@ class Parser:
                 if res.error: return res
                 else_case = (expr, False)
 
-        return res.success(else_case)
+        return res.success(IfNode(cases, else_case))
 
-    def if_expr_b_or_c(self):
+    def for_expr(self):
         res = ParseResult()
-        cases, else_case = [], None
-
-        if self.current_tok.matches(TT_KEYWORD, 'ELIF'):
-            all_cases = res.register(self.if_expr_b())
-            if res.error: return res
-            cases, else_case = all_cases
-        else:
-            else_case = res.register(self.if_expr_c())
-            if res.error: return res
+        res.register_advancement()
+        self.advance()
 
-        return res.success((cases, else_case))
+        if self.current_tok.type != TT_IDENTIFIER:
+            return res.failure(InvalidSyntaxError(
+                self.current_tok.pos_start, self.current_tok.pos_end,
+                f"Expected identifier"
+            ))
 
-    def if_expr_cases(self, case_keyword):
-        res = ParseResult()
-        cases = []
-        else_case = None
+        var_name = self.current_tok
+        res.register_advancement()
+        self.advance()
 
-        if not self.current_tok.matches(TT_KEYWORD, case_keyword):
+        if self.current_tok.type != TT_EQ:
             return res.failure(InvalidSyntaxError(
                 self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected '{case_keyword}'"
+                f"Expected '='"
             ))
 
         res.register_advancement()
         self.advance()
 
-        condition = res.register(self.expr())
+        start_value = res.register(self.expr())
         if res.error: return res
 
-        if not self.current_tok.matches(TT_KEYWORD, 'THEN'):
+        if not self.current_tok.matches(TT_KEYWORD, 'TO'):
             return res.failure(InvalidSyntaxError(
                 self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected 'THEN'"
+                f"Expected 'TO'"
             ))
 
         res.register_advancement()
         self.advance()
 
-        if self.current_tok.type == TT_NEWLINE:
+        end_value = res.register(self.expr())
+        if res.error: return res
+
+        if self.current_tok.matches(TT_KEYWORD, 'STEP'):
             res.register_advancement()
             self.advance()
 
-            statements = res.register(self.statements())
-            if res.error: return res
-            cases.append((condition, statements, True))
-
-            if self.current_tok.matches(TT_KEYWORD, 'END'):
-                res.register_advancement()
-                self.advance()
-            else:
-                all_cases = res.register(self.if_expr_b_or_c())
-                if res.error: return res
-                new_cases, else_case = all_cases
-                cases.extend(new_cases)
-        else:
-            expr = res.register(self.statement())
-            if res.error: return res
-            cases.append((condition, expr, False))
-
-            all_cases = res.register(self.if_expr_b_or_c())
-            if res.error: return res
-            new_cases, else_case = all_cases
-            cases.extend(new_cases)
-
-        return res.success((cases, else_case))
-
-    def for_expr(self):
-        res = ParseResult()
-
-        if not self.current_tok.matches(TT_KEYWORD, 'FOR'):
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected 'FOR'"
-            ))
-
-        res.register_advancement()
-        self.advance()
-
-        if self.current_tok.type != TT_IDENTIFIER:
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected identifier"
-            ))
-
-        var_name = self.current_tok
-        res.register_advancement()
-        self.advance()
-
-        if self.current_tok.type != TT_EQ:
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected '='"
-            ))
-
-        res.register_advancement()
-        self.advance()
-
-        start_value = res.register(self.expr())
-        if res.error: return res
-
-        if not self.current_tok.matches(TT_KEYWORD, 'TO'):
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected 'TO'"
-            ))
-
-        res.register_advancement()
-        self.advance()
-
-        end_value = res.register(self.expr())
-        if res.error: return res
-
-        if self.current_tok.matches(TT_KEYWORD, 'STEP'):
-            res.register_advancement()
-            self.advance()
-
-            step_value = res.register(self.expr())
+            step_value = res.register(self.expr())
             if res.error: return res
         else:
             step_value = None
@@ -1120,6 +1199,7 @@ class Parser:
 
             body = res.register(self.statements())
             if res.error: return res
+            self.discard_value(body)
 
             if not self.current_tok.matches(TT_KEYWORD, 'END'):
                 return res.failure(InvalidSyntaxError(
@@ -1139,13 +1219,6 @@ class Parser:
 
     def while_expr(self):
         res = ParseResult()
-
-        if not self.current_tok.matches(TT_KEYWORD, 'WHILE'):
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected 'WHILE'"
-            ))
-
         res.register_advancement()
         self.advance()
 
@@ -1167,6 +1240,7 @@ class Parser:
 
             body = res.register(self.statements())
             if res.error: return res
+            self.discard_value(body)
 
             if not self.current_tok.matches(TT_KEYWORD, 'END'):
                 return res.failure(InvalidSyntaxError(
@@ -1186,13 +1260,6 @@ class Parser:
 
     def func_def(self):
         res = ParseResult()
-
-        if not self.current_tok.matches(TT_KEYWORD, 'FUN'):
-            return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
-                f"Expected 'FUN'"
-            ))
-
         res.register_advancement()
         self.advance()
 
@@ -1276,6 +1343,7 @@ class Parser:
 
         body = res.register(self.statements())
         if res.error: return res
+        self.discard_value(body)
 
         if not self.current_tok.matches(TT_KEYWORD, 'END'):
             return res.failure(InvalidSyntaxError(
@@ -1293,25 +1361,27 @@ class Parser:
             False
         ))
 
-    ###################################
-
-    def bin_op(self, func_a, ops, func_b=None):
-        if func_b == None:
-            func_b = func_a
-
-        res = ParseResult()
-        left = res.register(func_a())
-        if res.error: return res
-
-        while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
-            op_tok = self.current_tok
-            res.register_advancement()
-            self.advance()
-            right = res.register(func_b())
-            if res.error: return res
-            left = BinOpNode(left, op_tok, right)
-
-        return res.success(left)
+    def discard_value(self, node):
+        # Marks the loops whose value is never used, such as the statements
+        # of a block, so that they do not collect the value of every
+        # iteration into a list. Nodes that are already marked were handled
+        # when their own block was parsed.
+        if isinstance(node, ListNode):
+            for element_node in node.element_nodes:
+                self.discard_value(element_node)
+        elif isinstance(node, (ForNode, WhileNode)):
+            if not node.should_return_null:
+                node.should_return_null = True
+                self.discard_value(node.body_node)
+        elif isinstance(node, IfNode):
+            for i, (condition, expr, should_return_null) in enumerate(node.cases):
+                if not should_return_null:
+                    node.cases[i] = (condition, expr, True)
+                    self.discard_value(expr)
+
+            if node.else_case and not node.else_case[1]:
+                node.else_case = (node.else_case[0], True)
+                self.discard_value(node.else_case[0])
 
 
 #######################################
@@ -1370,12 +1440,83 @@ class RTResult:
                 self.loop_should_break
         )
 
+    def unwrap(self):
+        # Re-raises whatever this result carries as the matching control flow
+        # exception, so RTResult-returning code can be called from visit_*.
+        if self.error:
+            raise RTErrorException(self.error)
+        if self.loop_should_break:
+            raise BREAK_EXCEPTION.with_traceback(None)
+        if self.loop_should_continue:
+            raise CONTINUE_EXCEPTION.with_traceback(None)
+        if self.func_return_value:
+            raise ReturnException(self.func_return_value)
+        return self.value
+
+    @staticmethod
+    def from_exception(exception):
+        res = RTResult()
+
+        if isinstance(exception, RTErrorException):
+            return res.failure(exception.error)
+        if isinstance(exception, ReturnException):
+            return res.success_return(exception.value)
+        if isinstance(exception, BreakException):
+            return res.success_break()
+        return res.success_continue()
+
+
+#######################################
+# CONTROL FLOW
+#######################################
+
+class ControlFlowException(Exception):
+    pass
+
+
+class RTErrorException(ControlFlowException):
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+
+class ReturnException(ControlFlowException):
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+
+class BreakException(ControlFlowException):
+    pass
+
+
+class ContinueException(ControlFlowException):
+    pass
+
+
+class TailCall:
+    # The value of a call in tail position: the function and arguments for
+    # the caller's Function.call loop to run next, in place of recursing.
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+
+# BREAK and CONTINUE carry no data, so one preallocated instance of each is
+# raised every time (with its traceback cleared so it cannot grow).
+BREAK_EXCEPTION = BreakException()
+CONTINUE_EXCEPTION = ContinueException()
+
 
 #######################################
 # VALUES
 #######################################
 
 class Value:
+    __slots__ = ('pos_start', 'pos_end', 'context')
+
     def __init__(self):
         self.set_pos()
         self.set_context()
@@ -1437,6 +1578,10 @@ class Value:
     def copy(self):
         raise Exception('No copy method defined')
 
+    def located(self, pos_start, pos_end, context):
+        # A copy of this value placed at a node, used to report an error there.
+        return self.copy().set_pos(pos_start, pos_end).set_context(context)
+
     def is_true(self):
         return False
 
@@ -1449,26 +1594,65 @@ class Value:
         )
 
 
-class Number(Value):
+class SharedValue(Value):
+    # A value that is shared rather than copied when it is read, so every
+    # variable, list and expression holding it sees the same instance: copy()
+    # returns the value itself and set_pos/set_context leave it untouched.
+    # Only located() makes a fresh copy carrying a position, when an error
+    # has to point at it.
+    __slots__ = ()
+
+    def set_pos(self, pos_start=None, pos_end=None):
+        return self
+
+    def set_context(self, context=None):
+        return self
+
+    def copy(self):
+        return self
+
+    def located(self, pos_start, pos_end, context):
+        copy = self.clone()
+        copy.pos_start = pos_start
+        copy.pos_end = pos_end
+        copy.context = context
+        return copy
+
+    def clone(self):
+        raise Exception('No clone method defined')
+
+
+class Number(SharedValue):
+    # Numbers are immutable, so sharing them is always safe.
+    __slots__ = ('value',)
+
     def __init__(self, value):
-        super().__init__()
         self.value = value
+        self.pos_start = None
+        self.pos_end = None
+        self.context = None
 
     def added_to(self, other):
         if isinstance(other, Number):
-            return Number(self.value + other.value).set_context(self.context), None
+            return make_number(self.value + other.value), None
+        elif isinstance(other, Array):
+            return other.reflected(self, operator.add)
         else:
             return None, Value.illegal_operation(self, other)
 
     def subbed_by(self, other):
         if isinstance(other, Number):
-            return Number(self.value - other.value).set_context(self.context), None
+            return make_number(self.value - other.value), None
+        elif isinstance(other, Array):
+            return other.reflected(self, operator.sub)
         else:
             return None, Value.illegal_operation(self, other)
 
     def multed_by(self, other):
         if isinstance(other, Number):
-            return Number(self.value * other.value).set_context(self.context), None
+            return make_number(self.value * other.value), None
+        elif isinstance(other, Array):
+            return other.reflected(self, operator.mul)
         else:
             return None, Value.illegal_operation(self, other)
 
@@ -1481,72 +1665,71 @@ class Number(Value):
                     self.context
                 )
 
-            return Number(self.value / other.value).set_context(self.context), None
+            return Number(self.value / other.value), None
+        elif isinstance(other, Array):
+            return other.reflected(self, operator.truediv)
         else:
             return None, Value.illegal_operation(self, other)
 
     def powed_by(self, other):
         if isinstance(other, Number):
-            return Number(self.value ** other.value).set_context(self.context), None
+            return make_number(self.value ** other.value), None
         else:
             return None, Value.illegal_operation(self, other)
 
     def get_comparison_eq(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value == other.value)).set_context(self.context), None
+            return Number.true if self.value == other.value else Number.false, None
         else:
             return None, Value.illegal_operation(self, other)
 
     def get_comparison_ne(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value != other.value)).set_context(self.context), None
+            return Number.true if self.value != other.value else Number.false, None
         else:
             return None, Value.illegal_operation(self, other)
 
     def get_comparison_lt(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value < other.value)).set_context(self.context), None
+            return Number.true if self.value < other.value else Number.false, None
         else:
             return None, Value.illegal_operation(self, other)
 
     def get_comparison_gt(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value > other.value)).set_context(self.context), None
+            return Number.true if self.value > other.value else Number.false, None
         else:
             return None, Value.illegal_operation(self, other)
 
     def get_comparison_lte(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value <= other.value)).set_context(self.context), None
+            return Number.true if self.value <= other.value else Number.false, None
         else:
             return None, Value.illegal_operation(self, other)
 
     def get_comparison_gte(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value >= other.value)).set_context(self.context), None
+            return Number.true if self.value >= other.value else Number.false, None
         else:
             return None, Value.illegal_operation(self, other)
 
     def anded_by(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value and other.value)).set_context(self.context), None
+            return make_number(int(self.value and other.value)), None
         else:
             return None, Value.illegal_operation(self, other)
 
     def ored_by(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value or other.value)).set_context(self.context), None
+            return make_number(int(self.value or other.value)), None
         else:
             return None, Value.illegal_operation(self, other)
 
     def notted(self):
-        return Number(1 if self.value == 0 else 0).set_context(self.context), None
+        return Number.true if self.value == 0 else Number.false, None
 
-    def copy(self):
-        copy = Number(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
+    def clone(self):
+        return Number(self.value)
 
     def is_true(self):
         return self.value != 0
@@ -1562,33 +1745,134 @@ Number.null = Number(0)
 Number.false = Number(0)
 Number.true = Number(1)
 Number.math_PI = Number(math.pi)
+Number.minus_one = Number(-1)
+
+SMALL_NUMBER_MIN = -5
+SMALL_NUMBER_MAX = 256
+SMALL_NUMBERS = [Number(value) for value in range(SMALL_NUMBER_MIN, SMALL_NUMBER_MAX + 1)]
+
+
+def make_number(value):
+    # Small integers are interned, like CPython does for its own ints.
+    if type(value) is int and SMALL_NUMBER_MIN <= value <= SMALL_NUMBER_MAX:
+        return SMALL_NUMBERS[value - SMALL_NUMBER_MIN]
+    return Number(value)
+
+
+# Each binary operation on two Numbers as a function of the operands that
+# skips the method's type checks. It has to give the same value as the
+# Number method, and None where that gives an error.
+NUMBER_OPERATIONS = {
+    'added_to': lambda left, right: make_number(left.value + right.value),
+    'subbed_by': lambda left, right: make_number(left.value - right.value),
+    'multed_by': lambda left, right: make_number(left.value * right.value),
+    'dived_by': lambda left, right: Number(left.value / right.value) if right.value != 0 else None,
+    'powed_by': lambda left, right: make_number(left.value ** right.value),
+    'get_comparison_eq': lambda left, right: Number.true if left.value == right.value else Number.false,
+    'get_comparison_ne': lambda left, right: Number.true if left.value != right.value else Number.false,
+    'get_comparison_lt': lambda left, right: Number.true if left.value < right.value else Number.false,
+    'get_comparison_gt': lambda left, right: Number.true if left.value > right.value else Number.false,
+    'get_comparison_lte': lambda left, right: Number.true if left.value <= right.value else Number.false,
+    'get_comparison_gte': lambda left, right: Number.true if left.value >= right.value else Number.false,
+    'anded_by': lambda left, right: make_number(int(left.value and right.value)),
+    'ored_by': lambda left, right: make_number(int(left.value or right.value)),
+}
+
+specialised_operations = {}
+
+
+def specialised_operation(method_name, left_type, right_type):
+    # The binary operation method_name for operands of exactly these types,
+    # as a function of the two operands that returns the result, or None
+    # when the operation fails. Made once per combination and shared.
+    key = (method_name, left_type, right_type)
+    operation = specialised_operations.get(key)
+
+    if operation is None:
+        if left_type is Number and right_type is Number:
+            operation = NUMBER_OPERATIONS[method_name]
+        else:
+            method = getattr(left_type, method_name)
+            operation = lambda left, right: method(left, right)[0]
+
+        specialised_operations[key] = operation
+
+    return operation
 
 
-class String(Value):
+STRING_FLAT_LENGTH = 256
+
+
+class String(SharedValue):
+    # Strings are immutable, so sharing them is always safe.
+    #
+    # A long string built with + is kept as the first `piece_count` pieces of
+    # a Python list, which strings built from it with + keep appending to (as
+    # List does with its backing list), so building a string in a loop is
+    # linear. The pieces are only joined when the text is read, by printing,
+    # indexing or any other operation on it.
+    __slots__ = ('text', 'pieces', 'piece_count', 'length')
+
     def __init__(self, value):
-        super().__init__()
-        self.value = value
+        self.text = value
+        self.pieces = None
+        self.piece_count = 0
+        self.length = len(value)
+        self.pos_start = None
+        self.pos_end = None
+        self.context = None
+
+    @staticmethod
+    def built(pieces, length):
+        string = String('')
+        string.text = None
+        string.pieces = pieces
+        string.piece_count = len(pieces)
+        string.length = length
+        return string
+
+    @property
+    def value(self):
+        if self.text is None:
+            pieces = self.pieces
+            if self.piece_count != len(pieces):
+                pieces = pieces[:self.piece_count]
+
+            self.text = ''.join(pieces)
+            self.pieces = None
+        return self.text
 
     def added_to(self, other):
         if isinstance(other, String):
-            return String(self.value + other.value).set_context(self.context), None
+            text = other.value
+            length = self.length + len(text)
+
+            if length <= STRING_FLAT_LENGTH:
+                return String(self.value + text), None
+
+            pieces = self.pieces
+            if pieces is None:
+                pieces = [self.text, text]
+            elif self.piece_count == len(pieces):
+                pieces.append(text)
+            else:
+                pieces = pieces[:self.piece_count] + [text]
+
+            return String.built(pieces, length), None
         else:
             return None, Value.illegal_operation(self, other)
 
     def multed_by(self, other):
         if isinstance(other, Number):
-            return String(self.value * other.value).set_context(self.context), None
+            return String(self.value * other.value), None
         else:
             return None, Value.illegal_operation(self, other)
 
     def is_true(self):
-        return len(self.value) > 0
+        return self.length > 0
 
-    def copy(self):
-        copy = String(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
+    def clone(self):
+        return String(self.value)
 
     def __str__(self):
         return self.value
@@ -1597,22 +1881,81 @@ class String(Value):
         return f'"{self.value}"'
 
 
-class List(Value):
-    def __init__(self, elements):
-        super().__init__()
-        self.elements = elements
+class List(SharedValue):
+    # Lists are shared by reference: APPEND, EXTEND and POP change a list in
+    # place for everyone holding it, while +, * and - build a new list.
+    #
+    # A list is a view of the first `length` items of a backing Python list,
+    # which lists built from it with + and * keep using. Adding items past
+    # the end of a backing list is always safe, since no view reaches that
+    # far, so growing a list is amortised O(1). Anything else that changes a
+    # backing list first takes a private copy if it is shared.
+    __slots__ = ('backing', 'length', 'shared')
+
+    def __init__(self, elements, length=None, shared=False):
+        self.backing = elements
+        self.length = len(elements) if length is None else length
+        self.shared = shared
+        self.pos_start = None
+        self.pos_end = None
+        self.context = None
+
+    @property
+    def elements(self):
+        # Read only: the list's items, without copying when it can be helped.
+        if self.length == len(self.backing):
+            return self.backing
+        return self.backing[:self.length]
+
+    def unshare(self):
+        self.backing = self.backing[:self.length]
+        self.shared = False
+
+    def append(self, value):
+        if self.length != len(self.backing):
+            self.unshare()
+
+        self.backing.append(value)
+        self.length += 1
+
+    def extend(self, values):
+        if self.length != len(self.backing):
+            self.unshare()
+
+        self.backing.extend(values)
+        self.length = len(self.backing)
+
+    def pop(self, index):
+        if self.shared or self.length != len(self.backing):
+            self.unshare()
+
+        value = self.backing.pop(index)
+        self.length -= 1
+        return value
+
+    def concatenated(self, values):
+        if self.length != len(self.backing):
+            return List(self.backing[:self.length] + values)
+
+        self.backing.extend(values)
+        self.shared = True
+        return List(self.backing, len(self.backing), True)
 
     def added_to(self, other):
-        new_list = self.copy()
-        new_list.elements.append(other)
-        return new_list, None
+        return self.concatenated([other]), None
 
     def subbed_by(self, other):
         if isinstance(other, Number):
-            new_list = self.copy()
+            index = other.value
+
+            if type(index) is int and self.length > 0 and index in (self.length - 1, -1):
+                self.shared = True
+                return List(self.backing, self.length - 1, True), None
+
+            elements = self.backing[:self.length]
             try:
-                new_list.elements.pop(other.value)
-                return new_list, None
+                elements.pop(index)
+                return List(elements), None
             except:
                 return None, RTError(
                     other.pos_start, other.pos_end,
@@ -1624,46 +1967,205 @@ class List(Value):
 
     def multed_by(self, other):
         if isinstance(other, List):
-            new_list = self.copy()
-            new_list.elements.extend(other.elements)
-            return new_list, None
+            return self.concatenated(other.elements), None
         else:
             return None, Value.illegal_operation(self, other)
 
     def dived_by(self, other):
         if isinstance(other, Number):
-            try:
-                return self.elements[other.value], None
-            except:
+            index = other.value
+
+            if type(index) is int and -self.length <= index < self.length:
+                return self.backing[index if index >= 0 else index + self.length], None
+
+            return None, RTError(
+                other.pos_start, other.pos_end,
+                'Element at this index could not be retrieved from list because index is out of bounds',
+                self.context
+            )
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def clone(self):
+        return List(self.backing, self.length, self.shared)
+
+    def snapshot(self):
+        # A view of the list as it is now, which later changes made in place
+        # to either list cannot reach.
+        self.shared = True
+        return List(self.backing, self.length, True)
+
+    def __str__(self):
+        return ", ".join([str(x) for x in self.elements])
+
+    def __repr__(self):
+        return f'[{", ".join([repr(x) for x in self.elements])}]'
+
+
+ARRAY_TYPECODE = 'd'
+ARRAY_ITEM_SIZE = array.array(ARRAY_TYPECODE).itemsize
+ARRAY_REPR_THRESHOLD = 1000
+ARRAY_REPR_EDGE_ITEMS = 3
+
+
+class Array(SharedValue):
+    # A fixed-length array of floats backed by the array module. Arithmetic
+    # with a number or another array works element by element, and it runs
+    # (like the SUM, MIN, MAX and DOT built-ins) inside Python's C loops
+    # instead of taking one interpreted step per element.
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+        self.pos_start = None
+        self.pos_end = None
+        self.context = None
+
+    def combined(self, other, op):
+        if isinstance(other, Array):
+            if len(other.values) != len(self.values):
                 return None, RTError(
-                    other.pos_start, other.pos_end,
-                    'Element at this index could not be retrieved from list because index is out of bounds',
+                    self.pos_start, other.pos_end,
+                    'Arrays must be the same length',
                     self.context
                 )
+
+            operands = other.values
+        elif isinstance(other, Number):
+            operands = itertools.repeat(other.value)
         else:
             return None, Value.illegal_operation(self, other)
 
-    def copy(self):
-        copy = List(self.elements)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
+        return self.mapped(op, self.values, operands, other)
+
+    def reflected(self, number, op):
+        # number <op> array, for when the number is on the left.
+        return self.mapped(op, itertools.repeat(number.value), self.values, self)
+
+    def mapped(self, op, left_values, right_values, right):
+        try:
+            return Array(array.array(ARRAY_TYPECODE, map(op, left_values, right_values))), None
+        except ZeroDivisionError:
+            return None, RTError(
+                right.pos_start, right.pos_end,
+                'Division by zero',
+                self.context
+            )
+        except OverflowError:
+            return None, RTError(
+                right.pos_start, right.pos_end,
+                'Number is too large for an array',
+                self.context
+            )
+
+    def added_to(self, other):
+        return self.combined(other, operator.add)
+
+    def subbed_by(self, other):
+        return self.combined(other, operator.sub)
+
+    def multed_by(self, other):
+        return self.combined(other, operator.mul)
+
+    def dived_by(self, other):
+        return self.combined(other, operator.truediv)
+
+    def clone(self):
+        return Array(self.values)
 
     def __str__(self):
-        return ", ".join([str(x) for x in self.elements])
+        return ", ".join(self.value_strings())
 
     def __repr__(self):
-        return f'[{", ".join([repr(x) for x in self.elements])}]'
+        return f'array([{", ".join(self.value_strings())}])'
+
+    def value_strings(self):
+        values = self.values
+
+        if len(values) > ARRAY_REPR_THRESHOLD:
+            return ([str(x) for x in values[:ARRAY_REPR_EDGE_ITEMS]] + ['...'] +
+                    [str(x) for x in values[-ARRAY_REPR_EDGE_ITEMS:]])
+
+        return [str(x) for x in values]
+
+
+class Range(SharedValue):
+    # The integers from start up to (not including) end, made lazily so that
+    # a big range costs the same as a small one until it is read.
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+        self.pos_start = None
+        self.pos_end = None
+        self.context = None
+
+    def dived_by(self, other):
+        if not isinstance(other, Number):
+            return None, Value.illegal_operation(self, other)
+
+        try:
+            return make_number(self.values[other.value]), None
+        except (IndexError, TypeError):
+            return None, RTError(
+                other.pos_start, other.pos_end,
+                'Element at this index could not be retrieved from range because index is out of bounds',
+                self.context
+            )
+
+    def clone(self):
+        return Range(self.values)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return f'<range {self.values.start} TO {self.values.stop} STEP {self.values.step}>'
+
+
+def loop_range(start, end, step):
+    # The values a FOR loop counts through. Integer bounds use a lazy range;
+    # anything else (or a zero step) is counted the way the loop always was.
+    if type(start) is int and type(end) is int and type(step) is int and step != 0:
+        return range(start, end, step)
+
+    return stepped_values(start, end, step)
+
+
+def stepped_values(value, end, step):
+    if step >= 0:
+        while value < end:
+            yield value
+            value += step
+    else:
+        while value > end:
+            yield value
+            value += step
 
 
 class BaseFunction(Value):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         super().__init__()
         self.name = name or "<anonymous>"
 
-    def generate_new_context(self):
+    def generate_new_context(self, scope=None):
         new_context = Context(self.name, self.context, self.pos_start)
-        new_context.symbol_table = SymbolTable(new_context.parent.symbol_table)
+        new_context.symbol_table = SymbolTable(new_context.parent.symbol_table, scope)
+        return new_context
+
+    def generate_tail_context(self, caller_context, scope=None):
+        # For a tail call made from caller_context, which it replaces: the
+        # new context returns to wherever the caller would have, and the
+        # caller's variables (still readable through dynamic scoping) are
+        # folded into a single table. A value read somewhere else keeps the
+        # usual context.
+        if self.context is not caller_context or not caller_context.parent:
+            return self.generate_new_context(scope)
+
+        new_context = Context(self.name, caller_context.parent, caller_context.parent_entry_pos)
+        new_context.symbol_table = SymbolTable(caller_context.symbol_table.folded(), scope)
         return new_context
 
     def check_args(self, arg_names, args):
@@ -1701,28 +2203,62 @@ class BaseFunction(Value):
 
 
 class Function(BaseFunction):
-    def __init__(self, name, body_node, arg_names, should_auto_return):
+    __slots__ = ('body_node', 'arg_names', 'should_auto_return', 'scope')
+
+    def __init__(self, name, body_node, arg_names, should_auto_return, scope=None):
         super().__init__(name)
         self.body_node = body_node
         self.arg_names = arg_names
         self.should_auto_return = should_auto_return
+        self.scope = scope
 
     def execute(self, args):
-        res = RTResult()
-        interpreter = Interpreter()
-        exec_ctx = self.generate_new_context()
+        try:
+            return RTResult().success(self.call(args))
+        except ControlFlowException as e:
+            return RTResult.from_exception(e)
+
+    def call(self, args):
+        # Returns the function's value; errors, and BREAK or CONTINUE with no
+        # enclosing loop in the body, propagate to the caller as exceptions.
+        # A call in tail position comes back as a TailCall and is run by this
+        # loop, so a chain of tail calls stays one Python call deep.
+        if interpreter.call_depth >= BASIC_MAX_CALL_DEPTH:
+            raise RTErrorException(RTError(
+                self.pos_start, self.pos_end,
+                'Maximum recursion depth exceeded',
+                self.context
+            ))
 
-        res.register(self.check_and_populate_args(self.arg_names, args, exec_ctx))
-        if res.should_return(): return res
+        function = self
+        exec_ctx = None
+        interpreter.call_depth += 1
 
-        value = res.register(interpreter.visit(self.body_node, exec_ctx))
-        if res.should_return() and res.func_return_value == None: return res
+        try:
+            while True:
+                if exec_ctx is None:
+                    exec_ctx = function.generate_new_context(function.scope)
+                else:
+                    exec_ctx = function.generate_tail_context(exec_ctx, function.scope)
 
-        ret_value = (value if self.should_auto_return else None) or res.func_return_value or Number.null
-        return res.success(ret_value)
+                res = function.check_and_populate_args(function.arg_names, args, exec_ctx)
+                if res.error: raise RTErrorException(res.error)
+
+                try:
+                    value = interpreter.visit(function.body_node, exec_ctx)
+                    value = (value if function.should_auto_return else None) or Number.null
+                except ReturnException as e:
+                    value = e.value
+
+                if type(value) is not TailCall:
+                    return value
+
+                function, args = value.function, value.args
+        finally:
+            interpreter.call_depth -= 1
 
     def copy(self):
-        copy = Function(self.name, self.body_node, self.arg_names, self.should_auto_return)
+        copy = Function(self.name, self.body_node, self.arg_names, self.should_auto_return, self.scope)
         copy.set_context(self.context)
         copy.set_pos(self.pos_start, self.pos_end)
         return copy
@@ -1731,56 +2267,255 @@ class Function(BaseFunction):
         return f"<function {self.name}>"
 
 
-class BuiltInFunction(BaseFunction):
-    def __init__(self, name):
-        super().__init__(name)
+class CompiledFunction(Function):
+    __slots__ = ('code',)
+
+    def __init__(self, name, body_node, arg_names, should_auto_return, code, scope=None):
+        super().__init__(name, body_node, arg_names, should_auto_return, scope)
+        self.code = code
 
     def execute(self, args):
         res = RTResult()
-        exec_ctx = self.generate_new_context()
-
-        method_name = f'execute_{self.name}'
-        method = getattr(self, method_name, self.no_visit_method)
+        vm = VirtualMachine()
+        exec_ctx = self.generate_new_context(self.scope)
 
-        res.register(self.check_and_populate_args(method.arg_names, args, exec_ctx))
+        res.register(self.check_and_populate_args(self.arg_names, args, exec_ctx))
         if res.should_return(): return res
 
-        return_value = res.register(method(exec_ctx))
-        if res.should_return(): return res
-        return res.success(return_value)
+        value = res.register(vm.run(self.code, exec_ctx))
+        if res.should_return() and res.func_return_value == None: return res
 
-    def no_visit_method(self, node, context):
-        raise Exception(f'No execute_{self.name} method defined')
+        ret_value = (value if self.should_auto_return else None) or res.func_return_value or Number.null
+        return res.success(ret_value)
 
     def copy(self):
-        copy = BuiltInFunction(self.name)
+        copy = CompiledFunction(
+            self.name, self.body_node, self.arg_names, self.should_auto_return, self.code, self.scope
+        )
         copy.set_context(self.context)
         copy.set_pos(self.pos_start, self.pos_end)
         return copy
 
-    def __repr__(self):
-        return f"<built-in function {self.name}>"
 
-    #####################################
+class PythonFunction(Function):
+    # A function transpiled to Python: body is the generated Python function,
+    # which is passed the new context and the argument values.
+    __slots__ = ('body',)
 
-    def execute_print(self, exec_ctx):
-        print(str(exec_ctx.symbol_table.get('value')))
-        return RTResult().success(Number.null)
+    def __init__(self, name, body_node, arg_names, should_auto_return, body, scope=None):
+        super().__init__(name, body_node, arg_names, should_auto_return, scope)
+        self.body = body
 
-    execute_print.arg_names = ['value']
+    def call(self, args):
+        return self.invoke(args, self.context, self)
 
-    def execute_print_ret(self, exec_ctx):
-        return RTResult().success(String(str(exec_ctx.symbol_table.get('value'))))
+    def invoke(self, args, caller_context, site):
+        # Calls the function from caller_context at site (anything with a
+        # pos_start and pos_end), like Function.call does with a located copy
+        # of the function, but without making that copy.
+        if interpreter.call_depth >= BASIC_MAX_CALL_DEPTH:
+            raise RTErrorException(RTError(
+                site.pos_start, site.pos_end,
+                'Maximum recursion depth exceeded',
+                caller_context
+            ))
+
+        function = self
+        exec_ctx = None
+        interpreter.call_depth += 1
+
+        try:
+            while True:
+                if exec_ctx is None:
+                    exec_ctx = Context(function.name, caller_context, site.pos_start)
+                    exec_ctx.symbol_table = SymbolTable(caller_context.symbol_table, function.scope)
+                else:
+                    exec_ctx = function.generate_tail_context(exec_ctx, function.scope)
+
+                if len(args) != len(function.arg_names):
+                    if site is not None:
+                        function = function.located(site.pos_start, site.pos_end, caller_context)
+                    raise RTErrorException(function.check_args(function.arg_names, args).error)
+
+                value = function.body(exec_ctx, args)
+
+                if type(value) is not TailCall:
+                    return value
+
+                function, args = value.function, value.args
+                site = None
+        finally:
+            interpreter.call_depth -= 1
+
+    def copy(self):
+        copy = PythonFunction(self.name, self.body_node, self.arg_names, self.should_auto_return, self.body, self.scope)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+        return copy
+
+
+def index_of_value(elements, value):
+    # The index of the first element equal to value, or -1. Numbers compare
+    # by value as == does; other values compare by content where they have
+    # a memo_key, and by identity where they do not.
+    if isinstance(value, Number):
+        target = value.value
+        for index, element in enumerate(elements):
+            if type(element) is Number and element.value == target:
+                return index
+        return -1
+
+    key = memo_key(value)
+
+    for index, element in enumerate(elements):
+        if element is value or (key is not None and type(element) is type(value) and memo_key(element) == key):
+            return index
+
+    return -1
+
+
+def memo_key(value):
+    # A hashable stand-in for a value, compared by content, or None for a
+    # value (such as a function) that has no such stand-in. A list's key is
+    # taken from its items as they are at the time of the call.
+    if isinstance(value, Number):
+        return (Number, type(value.value), value.value)
+
+    if isinstance(value, String):
+        return (String, value.value)
+
+    if isinstance(value, List):
+        keys = tuple(memo_key(element) for element in value.elements)
+        return None if None in keys else (List, keys)
+
+    if isinstance(value, Array):
+        return (Array, value.values.tobytes())
+
+    if isinstance(value, Range):
+        return (Range, value.values)
+
+    return None
+
+
+class MemoCache:
+    # The results a memoised function has returned, least recently used
+    # first, with the hit and miss counts MEMO_STATS reports. It is shared by
+    # every copy of the function value.
+    __slots__ = ('entries', 'maxsize', 'hits', 'misses')
+
+    def __init__(self, maxsize):
+        self.entries = collections.OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+
+class MemoizedFunction(BaseFunction):
+    # A function whose results are cached on its argument values, for pure
+    # functions only. Calls with an argument that has no memo_key, such as a
+    # function, are passed straight through.
+    __slots__ = ('function', 'cache')
+
+    def __init__(self, function, cache):
+        super().__init__(function.name)
+        self.function = function
+        self.cache = cache
+
+    def execute(self, args):
+        keys = tuple(memo_key(arg) for arg in args)
+        function = self.function.located(self.pos_start, self.pos_end, self.context)
+
+        if None in keys:
+            return function.execute(args)
+
+        cache = self.cache
+        entries = cache.entries
+        value = entries.get(keys)
+
+        if value is not None:
+            cache.hits += 1
+            entries.move_to_end(keys)
+        else:
+            cache.misses += 1
+
+            res = function.execute(args)
+            if res.should_return(): return res
+
+            value = res.value.snapshot() if isinstance(res.value, List) else res.value
+            entries[keys] = value
+
+            if len(entries) > cache.maxsize:
+                entries.popitem(last=False)
+
+        return RTResult().success(value.snapshot() if isinstance(value, List) else value)
+
+    def copy(self):
+        copy = MemoizedFunction(self.function, self.cache)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+        return copy
+
+    def __repr__(self):
+        return f"<memoized function {self.name}>"
+
+
+class BuiltInFunction(SharedValue, BaseFunction):
+    # Built-in functions are immutable, so they are shared like numbers.
+    #
+    # Each one is looked up once, in BuiltInFunction.methods, as its
+    # execute_ method and the fewest and most arguments it takes (arguments
+    # with a default in the method are optional). The method is called with
+    # the argument values directly; a context for the call is only made when
+    # there is an error to report in it.
+    __slots__ = ('method', 'min_arity', 'arity')
+
+    def __init__(self, name):
+        self.name = name
+        self.method, self.min_arity, self.arity = BuiltInFunction.methods[name]
+        self.pos_start = None
+        self.pos_end = None
+        self.context = None
+
+    def execute(self, args):
+        if not self.min_arity <= len(args) <= self.arity:
+            arg_names = self.method.arg_names
+            return self.check_args(arg_names[:self.min_arity] if len(args) < self.min_arity else arg_names, args)
+
+        return self.method(self, *args)
+
+    def failure(self, details):
+        return RTResult().failure(RTError(
+            self.pos_start, self.pos_end,
+            details,
+            self.generate_new_context()
+        ))
+
+    def clone(self):
+        return BuiltInFunction(self.name)
+
+    def __repr__(self):
+        return f"<built-in function {self.name}>"
+
+    #####################################
+
+    def execute_print(self, value):
+        print(str(value))
+        return RTResult().success(Number.null)
+
+    execute_print.arg_names = ['value']
+
+    def execute_print_ret(self, value):
+        return RTResult().success(String(str(value)))
 
     execute_print_ret.arg_names = ['value']
 
-    def execute_input(self, exec_ctx):
+    def execute_input(self):
         text = input()
         return RTResult().success(String(text))
 
     execute_input.arg_names = []
 
-    def execute_input_int(self, exec_ctx):
+    def execute_input_int(self):
         while True:
             text = input()
             try:
@@ -1788,499 +2523,2811 @@ class BuiltInFunction(BaseFunction):
                 break
             except ValueError:
                 print(f"'{text}' must be an integer. Try again!")
-        return RTResult().success(Number(number))
+        return RTResult().success(make_number(number))
 
     execute_input_int.arg_names = []
 
-    def execute_clear(self, exec_ctx):
+    def execute_clear(self):
         os.system('cls' if os.name == 'nt' else 'cls')
         return RTResult().success(Number.null)
 
     execute_clear.arg_names = []
 
-    def execute_exit(self, exec_ctx):
+    def execute_exit(self):
         return RTResult().success(String('!#<@>#EeXxIiTt#<@>#!'))
 
     execute_exit.arg_names = []
 
-    def execute_is_number(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), Number)
+    def execute_is_number(self, value):
+        is_number = isinstance(value, Number)
         return RTResult().success(Number.true if is_number else Number.false)
 
     execute_is_number.arg_names = ["value"]
 
-    def execute_is_string(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), String)
+    def execute_is_string(self, value):
+        is_number = isinstance(value, String)
         return RTResult().success(Number.true if is_number else Number.false)
 
     execute_is_string.arg_names = ["value"]
 
-    def execute_is_list(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), List)
+    def execute_is_list(self, value):
+        is_number = isinstance(value, List)
         return RTResult().success(Number.true if is_number else Number.false)
 
     execute_is_list.arg_names = ["value"]
 
-    def execute_is_function(self, exec_ctx):
-        is_number = isinstance(exec_ctx.symbol_table.get("value"), BaseFunction)
+    def execute_is_function(self, value):
+        is_number = isinstance(value, BaseFunction)
         return RTResult().success(Number.true if is_number else Number.false)
 
     execute_is_function.arg_names = ["value"]
 
-    def execute_append(self, exec_ctx):
-        list_ = exec_ctx.symbol_table.get("list")
-        value = exec_ctx.symbol_table.get("value")
+    def execute_append(self, list_, value):
 
         if not isinstance(list_, List):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 "First argument must be list",
-                exec_ctx
+                self.generate_new_context()
             ))
 
-        list_.elements.append(value)
+        list_.append(value)
         return RTResult().success(Number.null)
 
     execute_append.arg_names = ["list", "value"]
 
-    def execute_pop(self, exec_ctx):
-        list_ = exec_ctx.symbol_table.get("list")
-        index = exec_ctx.symbol_table.get("index")
+    def execute_pop(self, list_, index):
 
         if not isinstance(list_, List):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 "First argument must be list",
-                exec_ctx
+                self.generate_new_context()
             ))
 
         if not isinstance(index, Number):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 "Second argument must be number",
-                exec_ctx
+                self.generate_new_context()
             ))
 
         try:
-            element = list_.elements.pop(index.value)
+            element = list_.pop(index.value)
         except:
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 'Element at this index could not be removed from list because index is out of bounds',
-                exec_ctx
+                self.generate_new_context()
             ))
         return RTResult().success(element)
 
     execute_pop.arg_names = ["list", "index"]
 
-    def execute_extend(self, exec_ctx):
-        listA = exec_ctx.symbol_table.get("listA")
-        listB = exec_ctx.symbol_table.get("listB")
+    def execute_extend(self, listA, listB):
 
         if not isinstance(listA, List):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 "First argument must be list",
-                exec_ctx
+                self.generate_new_context()
             ))
 
         if not isinstance(listB, List):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 "Second argument must be list",
-                exec_ctx
+                self.generate_new_context()
             ))
 
-        listA.elements.extend(listB.elements)
+        listA.extend(listB.elements)
         return RTResult().success(Number.null)
 
     execute_extend.arg_names = ["listA", "listB"]
 
-    def execute_len(self, exec_ctx):
-        list_ = exec_ctx.symbol_table.get("list")
+    def execute_len(self, list_):
+
+        if isinstance(list_, (Array, Range)):
+            return RTResult().success(make_number(len(list_.values)))
+
+        if isinstance(list_, String):
+            return RTResult().success(make_number(list_.length))
 
         if not isinstance(list_, List):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 "Argument must be list",
-                exec_ctx
+                self.generate_new_context()
             ))
 
-        return RTResult().success(Number(len(list_.elements)))
+        return RTResult().success(make_number(list_.length))
 
     execute_len.arg_names = ["list"]
 
-    def execute_run(self, exec_ctx):
-        fn = exec_ctx.symbol_table.get("fn")
+    def execute_join(self, list_, separator):
 
-        if not isinstance(fn, String):
+        if not isinstance(list_, List) or not all(isinstance(element, String) for element in list_.elements):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "First argument must be a list of strings",
+                self.generate_new_context()
+            ))
+
+        if not isinstance(separator, String):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
                 "Second argument must be string",
-                exec_ctx
+                self.generate_new_context()
             ))
 
-        fn = fn.value
+        return RTResult().success(String(separator.value.join([element.value for element in list_.elements])))
 
-        try:
-            with open(fn, "r") as f:
-                script = f.read()
-        except Exception as e:
+    execute_join.arg_names = ["list", "separator"]
+
+    def execute_split(self, string_, separator):
+
+        if not isinstance(string_, String):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
-                f"Failed to load script \"{fn}\"\n" + str(e),
-                exec_ctx
+                "First argument must be string",
+                self.generate_new_context()
             ))
 
-        _, error = run(fn, script)
+        if not isinstance(separator, String) or separator.length == 0:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Second argument must be a non-empty string",
+                self.generate_new_context()
+            ))
 
-        if error:
+        return RTResult().success(List([String(part) for part in string_.value.split(separator.value)]))
+
+    execute_split.arg_names = ["string", "separator"]
+
+    def execute_substr(self, string_, start, length):
+
+        if not isinstance(string_, String):
             return RTResult().failure(RTError(
                 self.pos_start, self.pos_end,
-                f"Failed to finish executing script \"{fn}\"\n" +
-                error.as_string(),
-                exec_ctx
+                "First argument must be string",
+                self.generate_new_context()
             ))
 
-        return RTResult().success(Number.null)
+        if not all(isinstance(bound, Number) and type(bound.value) is int and bound.value >= 0
+                   for bound in (start, length)):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Start and length must be non-negative integers",
+                self.generate_new_context()
+            ))
 
-    execute_run.arg_names = ["fn"]
+        return RTResult().success(String(string_.value[start.value:start.value + length.value]))
 
+    execute_substr.arg_names = ["string", "start", "length"]
 
-BuiltInFunction.print = BuiltInFunction("print")
-BuiltInFunction.print_ret = BuiltInFunction("print_ret")
-BuiltInFunction.input = BuiltInFunction("input")
-BuiltInFunction.input_int = BuiltInFunction("input_int")
-BuiltInFunction.clear = BuiltInFunction("clear")
-BuiltInFunction.is_number = BuiltInFunction("is_number")
-BuiltInFunction.is_string = BuiltInFunction("is_string")
-BuiltInFunction.is_list = BuiltInFunction("is_list")
-BuiltInFunction.is_function = BuiltInFunction("is_function")
-BuiltInFunction.append = BuiltInFunction("append")
-BuiltInFunction.pop = BuiltInFunction("pop")
-BuiltInFunction.extend = BuiltInFunction("extend")
-BuiltInFunction.len = BuiltInFunction("len")
-BuiltInFunction.run = BuiltInFunction("run")
-BuiltInFunction.exit = BuiltInFunction("exit")
+    def execute_find(self, string_, substring):
 
+        if not isinstance(string_, String) or not isinstance(substring, String):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Arguments must be strings",
+                self.generate_new_context()
+            ))
 
-#######################################
-# CONTEXT
-#######################################
+        return RTResult().success(make_number(string_.value.find(substring.value)))
 
-class Context:
-    def __init__(self, display_name, parent=None, parent_entry_pos=None):
-        self.display_name = display_name
-        self.parent = parent
-        self.parent_entry_pos = parent_entry_pos
-        self.symbol_table = None
+    execute_find.arg_names = ["string", "substring"]
 
+    def execute_run(self, fn):
 
-#######################################
-# SYMBOL TABLE
-#######################################
+        if not isinstance(fn, String):
+            return self.failure("Argument must be string")
 
-class SymbolTable:
-    def __init__(self, parent=None):
-        self.symbols = {}
-        self.parent = parent
+        if session is None:
+            return self.failure(f"Cannot load \"{fn.value}\" without a file system")
 
-    def get(self, name):
-        value = self.symbols.get(name, None)
-        if value == None and self.parent:
-            return self.parent.get(name)
-        return value
+        error = session.run_script(fn.value, self.context, self.pos_start)
 
-    def set(self, name, value):
-        self.symbols[name] = value
+        # An error raised while the script ran already traces back to here.
+        if isinstance(error, RTError):
+            return RTResult().failure(error)
 
-    def remove(self, name):
-        del self.symbols[name]
+        if error:
+            return self.failure(f"Failed to finish executing script \"{fn.value}\"\n" + error)
 
+        return RTResult().success(Number.null)
 
-#######################################
-# INTERPRETER
-#######################################
+    execute_run.arg_names = ["fn"]
 
-class Interpreter:
-    def visit(self, node, context):
-        method_name = f'visit_{type(node).__name__}'
-        method = getattr(self, method_name, self.no_visit_method)
-        return method(node, context)
+    def execute_import(self, fn):
 
-    def no_visit_method(self, node, context):
-        raise Exception(f'No visit_{type(node).__name__} method defined')
+        if not isinstance(fn, String):
+            return self.failure("Argument must be string")
 
-    ###################################
+        if session is None:
+            return self.failure(f"Cannot load \"{fn.value}\" without a file system")
 
-    def visit_NumberNode(self, node, context):
-        return RTResult().success(
-            Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        error = session.import_library(fn.value, self.context, self.pos_start)
 
-    def visit_StringNode(self, node, context):
-        return RTResult().success(
-            String(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        # An error raised while the script ran already traces back to here.
+        if isinstance(error, RTError):
+            return RTResult().failure(error)
 
-    def visit_ListNode(self, node, context):
-        res = RTResult()
-        elements = []
+        if error:
+            return self.failure(f"Failed to import library \"{fn.value}\"\n" + error)
 
-        for element_node in node.element_nodes:
-            elements.append(res.register(self.visit(element_node, context)))
-            if res.should_return(): return res
+        return RTResult().success(Number.null)
 
-        return res.success(
-            List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+    execute_import.arg_names = ["fn"]
 
-    def visit_VarAccessNode(self, node, context):
-        res = RTResult()
-        var_name = node.var_name_tok.value
-        value = context.symbol_table.get(var_name)
+    def execute_memoize(self, function, maxsize):
 
-        if not value:
-            return res.failure(RTError(
-                node.pos_start, node.pos_end,
-                f"'{var_name}' is not defined",
-                context
+        if not isinstance(function, BaseFunction):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "First argument must be function",
+                self.generate_new_context()
             ))
 
-        value = value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
-        return res.success(value)
+        if not isinstance(maxsize, Number) or type(maxsize.value) is not int or maxsize.value < 1:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Second argument must be a positive integer",
+                self.generate_new_context()
+            ))
 
-    def visit_VarAssignNode(self, node, context):
-        res = RTResult()
-        var_name = node.var_name_tok.value
-        value = res.register(self.visit(node.value_node, context))
-        if res.should_return(): return res
+        return RTResult().success(MemoizedFunction(function, MemoCache(maxsize.value)))
 
-        context.symbol_table.set(var_name, value)
-        return res.success(value)
+    execute_memoize.arg_names = ["fn", "maxsize"]
 
-    def visit_BinOpNode(self, node, context):
-        res = RTResult()
-        left = res.register(self.visit(node.left_node, context))
-        if res.should_return(): return res
-        right = res.register(self.visit(node.right_node, context))
-        if res.should_return(): return res
+    def execute_memo_stats(self, function):
 
-        if node.op_tok.type == TT_PLUS:
-            result, error = left.added_to(right)
-        elif node.op_tok.type == TT_MINUS:
-            result, error = left.subbed_by(right)
-        elif node.op_tok.type == TT_MUL:
-            result, error = left.multed_by(right)
-        elif node.op_tok.type == TT_DIV:
-            result, error = left.dived_by(right)
-        elif node.op_tok.type == TT_POW:
-            result, error = left.powed_by(right)
-        elif node.op_tok.type == TT_EE:
-            result, error = left.get_comparison_eq(right)
-        elif node.op_tok.type == TT_NE:
-            result, error = left.get_comparison_ne(right)
-        elif node.op_tok.type == TT_LT:
-            result, error = left.get_comparison_lt(right)
-        elif node.op_tok.type == TT_GT:
-            result, error = left.get_comparison_gt(right)
-        elif node.op_tok.type == TT_LTE:
-            result, error = left.get_comparison_lte(right)
-        elif node.op_tok.type == TT_GTE:
-            result, error = left.get_comparison_gte(right)
-        elif node.op_tok.matches(TT_KEYWORD, 'AND'):
-            result, error = left.anded_by(right)
-        elif node.op_tok.matches(TT_KEYWORD, 'OR'):
-            result, error = left.ored_by(right)
+        if not isinstance(function, MemoizedFunction):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argument must be memoized function",
+                self.generate_new_context()
+            ))
 
-        if error:
-            return res.failure(error)
-        else:
-            return res.success(result.set_pos(node.pos_start, node.pos_end))
+        cache = function.cache
+        return RTResult().success(List([
+            make_number(cache.hits), make_number(cache.misses),
+            make_number(len(cache.entries)), make_number(cache.maxsize)
+        ]))
 
-    def visit_UnaryOpNode(self, node, context):
-        res = RTResult()
-        number = res.register(self.visit(node.node, context))
-        if res.should_return(): return res
+    execute_memo_stats.arg_names = ["fn"]
 
-        error = None
+    def numeric_values(self, value):
+        # The numbers held by an array, or by a list of numbers.
+        if isinstance(value, (Array, Range)):
+            return value.values
 
-        if node.op_tok.type == TT_MINUS:
-            number, error = number.multed_by(Number(-1))
-        elif node.op_tok.matches(TT_KEYWORD, 'NOT'):
-            number, error = number.notted()
+        if isinstance(value, List) and all(isinstance(element, Number) for element in value.elements):
+            return [element.value for element in value.elements]
 
-        if error:
-            return res.failure(error)
-        else:
-            return res.success(number.set_pos(node.pos_start, node.pos_end))
+        return None
 
-    def visit_IfNode(self, node, context):
-        res = RTResult()
+    def execute_range(self, start, end, step=Number.true):
+        bounds = [start, end, step]
 
-        for condition, expr, should_return_null in node.cases:
-            condition_value = res.register(self.visit(condition, context))
-            if res.should_return(): return res
+        if not all(isinstance(bound, Number) and type(bound.value) is int for bound in bounds):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Arguments must be integers",
+                self.generate_new_context()
+            ))
 
-            if condition_value.is_true():
-                expr_value = res.register(self.visit(expr, context))
-                if res.should_return(): return res
-                return res.success(Number.null if should_return_null else expr_value)
+        if bounds[2].value == 0:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Step must not be zero",
+                self.generate_new_context()
+            ))
 
-        if node.else_case:
-            expr, should_return_null = node.else_case
-            expr_value = res.register(self.visit(expr, context))
-            if res.should_return(): return res
-            return res.success(Number.null if should_return_null else expr_value)
+        return RTResult().success(Range(range(*[bound.value for bound in bounds])))
 
-        return res.success(Number.null)
+    execute_range.arg_names = ["start", "end", "step"]
 
-    def visit_ForNode(self, node, context):
-        res = RTResult()
-        elements = []
+    def execute_array(self, size):
 
-        start_value = res.register(self.visit(node.start_value_node, context))
-        if res.should_return(): return res
+        if not isinstance(size, Number) or type(size.value) is not int or size.value < 0:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argument must be a non-negative integer",
+                self.generate_new_context()
+            ))
 
-        end_value = res.register(self.visit(node.end_value_node, context))
-        if res.should_return(): return res
+        return RTResult().success(Array(array.array(ARRAY_TYPECODE, bytes(size.value * ARRAY_ITEM_SIZE))))
 
-        if node.step_value_node:
-            step_value = res.register(self.visit(node.step_value_node, context))
-            if res.should_return(): return res
-        else:
-            step_value = Number(1)
+    execute_array.arg_names = ["size"]
 
-        i = start_value.value
+    def execute_to_array(self, list_):
+        values = self.numeric_values(list_)
 
-        if step_value.value >= 0:
-            condition = lambda: i < end_value.value
-        else:
-            condition = lambda: i > end_value.value
+        if values is None:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argument must be a list of numbers",
+                self.generate_new_context()
+            ))
 
-        while condition():
-            context.symbol_table.set(node.var_name_tok.value, Number(i))
-            i += step_value.value
+        try:
+            return RTResult().success(Array(array.array(ARRAY_TYPECODE, values)))
+        except OverflowError:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Number is too large for an array",
+                self.generate_new_context()
+            ))
 
-            value = res.register(self.visit(node.body_node, context))
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False: return res
+    execute_to_array.arg_names = ["list"]
 
-            if res.loop_should_continue:
-                continue
+    def execute_to_list(self, array_):
 
-            if res.loop_should_break:
-                break
+        if not isinstance(array_, (Array, Range)):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argument must be array or range",
+                self.generate_new_context()
+            ))
 
-            elements.append(value)
+        return RTResult().success(List([make_number(value) for value in array_.values]))
 
-        return res.success(
-            Number.null if node.should_return_null else
-            List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+    execute_to_list.arg_names = ["array"]
 
-    def visit_WhileNode(self, node, context):
-        res = RTResult()
-        elements = []
+    def execute_sum(self, values):
+        values = self.numeric_values(values)
 
-        while True:
-            condition = res.register(self.visit(node.condition_node, context))
-            if res.should_return(): return res
+        if values is None:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argument must be an array or a list of numbers",
+                self.generate_new_context()
+            ))
 
-            if not condition.is_true():
-                break
+        return RTResult().success(make_number(sum(values)))
 
-            value = res.register(self.visit(node.body_node, context))
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False: return res
+    execute_sum.arg_names = ["values"]
 
-            if res.loop_should_continue:
-                continue
+    def execute_min(self, values):
+        return self.reduce_values(values, min)
 
-            if res.loop_should_break:
-                break
+    execute_min.arg_names = ["values"]
 
-            elements.append(value)
+    def execute_max(self, values):
+        return self.reduce_values(values, max)
 
-        return res.success(
-            Number.null if node.should_return_null else
-            List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+    execute_max.arg_names = ["values"]
 
-    def visit_FuncDefNode(self, node, context):
-        res = RTResult()
+    def reduce_values(self, values, reduce):
+        values = self.numeric_values(values)
 
-        func_name = node.var_name_tok.value if node.var_name_tok else None
-        body_node = node.body_node
-        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
-        func_value = Function(func_name, body_node, arg_names, node.should_auto_return).set_context(context).set_pos(
-            node.pos_start, node.pos_end)
+        if values is None:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argument must be an array or a list of numbers",
+                self.generate_new_context()
+            ))
 
-        if node.var_name_tok:
-            context.symbol_table.set(func_name, func_value)
+        if len(values) == 0:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argument must not be empty",
+                self.generate_new_context()
+            ))
 
-        return res.success(func_value)
+        return RTResult().success(make_number(reduce(values)))
 
-    def visit_CallNode(self, node, context):
-        res = RTResult()
-        args = []
+    def execute_dot(self, arrayA, arrayB):
+        valuesA = self.numeric_values(arrayA)
+        valuesB = self.numeric_values(arrayB)
 
-        value_to_call = res.register(self.visit(node.node_to_call, context))
-        if res.should_return(): return res
-        value_to_call = value_to_call.copy().set_pos(node.pos_start, node.pos_end)
+        if valuesA is None or valuesB is None:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Arguments must be arrays or lists of numbers",
+                self.generate_new_context()
+            ))
+
+        if len(valuesA) != len(valuesB):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Arguments must be the same length",
+                self.generate_new_context()
+            ))
+
+        return RTResult().success(make_number(sum(map(operator.mul, valuesA, valuesB))))
+
+    execute_dot.arg_names = ["arrayA", "arrayB"]
+
+    def elements_of(self, value):
+        # The items of a list, or of an array or range as numbers.
+        if isinstance(value, List):
+            return value.elements
+
+        if isinstance(value, (Array, Range)):
+            return [make_number(element) for element in value.values]
+
+        return None
+
+    def execute_sort(self, list_, key=None):
+        elements = self.elements_of(list_)
+
+        if elements is None:
+            return self.failure("First argument must be list")
+
+        if key is None:
+            keys = elements
+        elif not isinstance(key, BaseFunction):
+            return self.failure("Second argument must be function")
+        else:
+            keys = []
+            for element in elements:
+                res = key.execute([element])
+                if res.should_return(): return res
+                keys.append(res.value)
+
+        if not (all(type(value) is Number for value in keys) or all(type(value) is String for value in keys)):
+            return self.failure("Sort keys must be all numbers or all strings")
+
+        keys = [value.value for value in keys]
+        return RTResult().success(List([elements[index] for index in sorted(range(len(keys)), key=keys.__getitem__)]))
+
+    execute_sort.arg_names = ["list", "key"]
+
+    def execute_map(self, list_, fn):
+        elements = self.elements_of(list_)
+
+        if elements is None:
+            return self.failure("First argument must be list")
+
+        if not isinstance(fn, BaseFunction):
+            return self.failure("Second argument must be function")
+
+        values = []
+        for element in elements:
+            res = fn.execute([element])
+            if res.should_return(): return res
+            values.append(res.value)
+
+        return RTResult().success(List(values))
+
+    execute_map.arg_names = ["list", "fn"]
+
+    def execute_filter(self, list_, fn):
+        elements = self.elements_of(list_)
+
+        if elements is None:
+            return self.failure("First argument must be list")
+
+        if not isinstance(fn, BaseFunction):
+            return self.failure("Second argument must be function")
+
+        values = []
+        for element in elements:
+            res = fn.execute([element])
+            if res.should_return(): return res
+            if res.value.is_true(): values.append(element)
+
+        return RTResult().success(List(values))
+
+    execute_filter.arg_names = ["list", "fn"]
+
+    def execute_reduce(self, list_, fn, initial=None):
+        elements = self.elements_of(list_)
+
+        if elements is None:
+            return self.failure("First argument must be list")
+
+        if not isinstance(fn, BaseFunction):
+            return self.failure("Second argument must be function")
+
+        if initial is None:
+            if len(elements) == 0:
+                return self.failure("Cannot reduce an empty list without an initial value")
+            initial, elements = elements[0], elements[1:]
+
+        value = initial
+        for element in elements:
+            res = fn.execute([value, element])
+            if res.should_return(): return res
+            value = res.value
+
+        return RTResult().success(value)
+
+    execute_reduce.arg_names = ["list", "fn", "initial"]
+
+    def execute_reverse(self, list_):
+        elements = self.elements_of(list_)
+
+        if elements is None:
+            return self.failure("Argument must be list")
+
+        return RTResult().success(List(elements[::-1]))
+
+    execute_reverse.arg_names = ["list"]
+
+    def execute_index_of(self, list_, value):
+        elements = self.elements_of(list_)
+
+        if elements is None:
+            return self.failure("First argument must be list")
+
+        return RTResult().success(make_number(index_of_value(elements, value)))
+
+    execute_index_of.arg_names = ["list", "value"]
+
+    def execute_contains(self, list_, value):
+        if isinstance(list_, String):
+            if not isinstance(value, String):
+                return self.failure("Second argument must be string")
+
+            return RTResult().success(Number.true if value.value in list_.value else Number.false)
+
+        elements = self.elements_of(list_)
+
+        if elements is None:
+            return self.failure("First argument must be list or string")
+
+        return RTResult().success(Number.true if index_of_value(elements, value) != -1 else Number.false)
+
+    execute_contains.arg_names = ["list", "value"]
+
+    def execute_slice(self, value, start, end):
+        if not all(isinstance(bound, Number) and type(bound.value) is int for bound in (start, end)):
+            return self.failure("Start and end must be integers")
+
+        if isinstance(value, List):
+            return RTResult().success(List(value.elements[start.value:end.value]))
+
+        if isinstance(value, String):
+            return RTResult().success(String(value.value[start.value:end.value]))
+
+        if isinstance(value, (Array, Range)):
+            return RTResult().success(type(value)(value.values[start.value:end.value]))
+
+        return self.failure("First argument must be list, string, array or range")
+
+    execute_slice.arg_names = ["value", "start", "end"]
+
+
+BuiltInFunction.methods = {
+    name[len('execute_'):]: (method, len(method.arg_names) - len(method.__defaults__ or ()), len(method.arg_names))
+    for name, method in vars(BuiltInFunction).items()
+    if name.startswith('execute_')
+}
+
+BuiltInFunction.print = BuiltInFunction("print")
+BuiltInFunction.print_ret = BuiltInFunction("print_ret")
+BuiltInFunction.input = BuiltInFunction("input")
+BuiltInFunction.input_int = BuiltInFunction("input_int")
+BuiltInFunction.clear = BuiltInFunction("clear")
+BuiltInFunction.is_number = BuiltInFunction("is_number")
+BuiltInFunction.is_string = BuiltInFunction("is_string")
+BuiltInFunction.is_list = BuiltInFunction("is_list")
+BuiltInFunction.is_function = BuiltInFunction("is_function")
+BuiltInFunction.append = BuiltInFunction("append")
+BuiltInFunction.pop = BuiltInFunction("pop")
+BuiltInFunction.extend = BuiltInFunction("extend")
+BuiltInFunction.len = BuiltInFunction("len")
+BuiltInFunction.join = BuiltInFunction("join")
+BuiltInFunction.split = BuiltInFunction("split")
+BuiltInFunction.substr = BuiltInFunction("substr")
+BuiltInFunction.find = BuiltInFunction("find")
+BuiltInFunction.run = BuiltInFunction("run")
+BuiltInFunction.import_ = BuiltInFunction("import")
+BuiltInFunction.exit = BuiltInFunction("exit")
+BuiltInFunction.memoize = BuiltInFunction("memoize")
+BuiltInFunction.memo_stats = BuiltInFunction("memo_stats")
+BuiltInFunction.range = BuiltInFunction("range")
+BuiltInFunction.array = BuiltInFunction("array")
+BuiltInFunction.to_array = BuiltInFunction("to_array")
+BuiltInFunction.to_list = BuiltInFunction("to_list")
+BuiltInFunction.sum = BuiltInFunction("sum")
+BuiltInFunction.min = BuiltInFunction("min")
+BuiltInFunction.max = BuiltInFunction("max")
+BuiltInFunction.dot = BuiltInFunction("dot")
+BuiltInFunction.sort = BuiltInFunction("sort")
+BuiltInFunction.map = BuiltInFunction("map")
+BuiltInFunction.filter = BuiltInFunction("filter")
+BuiltInFunction.reduce = BuiltInFunction("reduce")
+BuiltInFunction.reverse = BuiltInFunction("reverse")
+BuiltInFunction.index_of = BuiltInFunction("index_of")
+BuiltInFunction.contains = BuiltInFunction("contains")
+BuiltInFunction.slice = BuiltInFunction("slice")
+
+
+def locate_operation_error(left, method_name, right, left_pos, right_pos, context):
+    # Shared values carry no position, so a failed operation is run again on
+    # copies placed at its operand nodes to get an error pointing there.
+    # Operations only change anything when they succeed.
+    left = left.located(left_pos[0], left_pos[1], context)
+    right = right.located(right_pos[0], right_pos[1], context)
+    return getattr(left, method_name)(right)[1]
+
+
+#######################################
+# CONTEXT
+#######################################
+
+class Context:
+    def __init__(self, display_name, parent=None, parent_entry_pos=None):
+        self.display_name = display_name
+        self.parent = parent
+        self.parent_entry_pos = parent_entry_pos
+        self.symbol_table = None
+
+
+#######################################
+# SYMBOL TABLE
+#######################################
+
+class Scope:
+    # Maps the names bound in one function body (or at the top level) to
+    # slot indices in the frames created for it.
+    __slots__ = ('slots',)
+
+    def __init__(self):
+        self.slots = {}
+
+    def define(self, name):
+        slot = self.slots.get(name)
+
+        if slot is None:
+            slot = self.slots[name] = len(self.slots)
+
+        return slot
+
+
+class SymbolTable:
+    # An array-backed frame: its scope gives each name a slot in values. The
+    # Resolver hands slots out ahead of time, so reads and writes can index
+    # straight into a frame; get and set by name still work for everything
+    # else. The global table also records every name that has been bound in
+    # some other frame, since only those names can be shadowed by a caller.
+    __slots__ = ('scope', 'values', 'parent', 'global_table', 'local_names', 'is_fold')
+
+    def __init__(self, parent=None, scope=None):
+        self.scope = scope or Scope()
+        self.values = [None] * len(self.scope.slots)
+        self.parent = parent
+        self.global_table = parent.global_table if parent else self
+        self.local_names = None if parent else set()
+        self.is_fold = False
+
+    def folded(self):
+        # The values still visible through this frame once its function has
+        # made a tail call, gathered into one table. The frame can no longer
+        # change, so it is merged with the fold it was itself called from,
+        # and a tail-recursive loop keeps a single table instead of a chain.
+        tables = (self.parent, self) if self.parent.is_fold else (self,)
+        bindings = {}
+
+        for table in tables:
+            for name, slot in table.scope.slots.items():
+                if slot < len(table.values) and table.values[slot] is not None:
+                    bindings[name] = table.values[slot]
+
+        scope = Scope()
+        scope.slots = {name: slot for slot, name in enumerate(bindings)}
+
+        fold = SymbolTable(tables[0].parent, scope)
+        fold.values = list(bindings.values())
+        fold.is_fold = True
+        return fold
+
+    def define(self, name):
+        slot = self.scope.slots.get(name)
+
+        if slot is None:
+            slot = self.scope.define(name)
+            if self.parent: self.global_table.local_names.add(name)
+
+        if slot >= len(self.values):
+            self.values.extend([None] * (slot + 1 - len(self.values)))
+
+        return slot
+
+    def get(self, name):
+        table = self
+
+        while table:
+            slot = table.scope.slots.get(name)
+
+            if slot is not None and slot < len(table.values):
+                value = table.values[slot]
+                if value is not None: return value
+
+            table = table.parent
+
+        return None
+
+    def lookup(self, name, local_slot, global_slot):
+        # Scoping is dynamic, so an empty local slot (a read before the first
+        # assignment) falls back to the calling frames, and a global slot can
+        # only be used directly when no frame could be shadowing the name.
+        if local_slot is not None:
+            value = self.values[local_slot]
+            if value is None and self.parent: return self.parent.get(name)
+            return value
+
+        if global_slot is not None and name not in self.global_table.local_names:
+            return self.global_table.values[global_slot]
+
+        return self.get(name)
+
+    def set(self, name, value):
+        self.values[self.define(name)] = value
+
+    def assign(self, name, slot, value):
+        if slot is None:
+            self.set(name, value)
+        else:
+            self.values[slot] = value
+
+    def remove(self, name):
+        self.values[self.scope.slots[name]] = None
+
+
+#######################################
+# INTERPRETER
+#######################################
+
+# BASIC calls nest at most this deep, in the interpreter and the VM alike.
+BASIC_MAX_CALL_DEPTH = 200000
+
+# The interpreter recurses in Python for every node it visits (and the VM
+# does for each call that goes through a built-in or memoised function), so
+# Python's own limit is raised while a program runs, leaving room for
+# BASIC_MAX_CALL_DEPTH calls. From Python 3.11 a Python-to-Python call no longer uses the C
+# stack, so only the limit stands in the way; older versions keep theirs.
+INTERPRETER_RECURSION_LIMIT = BASIC_MAX_CALL_DEPTH * 20
+PYTHON_CALLS_USE_C_STACK = sys.version_info < (3, 11)
+
+
+class Interpreter:
+    # visit_* methods return the node's value directly. RETURN, BREAK,
+    # CONTINUE and runtime errors leave a node by raising one of the
+    # control flow exceptions, so the normal path allocates no result object.
+    def __init__(self):
+        self.call_depth = 0
+        self.visit_methods = {}
+
+    def visit(self, node, context):
+        method = self.visit_methods.get(type(node))
+
+        if method is None:
+            method_name = f'visit_{type(node).__name__}'
+            method = self.visit_methods[type(node)] = getattr(self, method_name, self.no_visit_method)
+
+        return method(node, context)
+
+    def no_visit_method(self, node, context):
+        raise Exception(f'No visit_{type(node).__name__} method defined')
+
+    ###################################
+
+    def visit_NumberNode(self, node, context):
+        return make_number(node.tok.value)
+
+    def visit_StringNode(self, node, context):
+        return String(node.tok.value)
+
+    def visit_ListNode(self, node, context):
+        elements = [self.visit(element_node, context) for element_node in node.element_nodes]
+        return List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
+
+    def visit_VarAccessNode(self, node, context):
+        var_name = node.var_name_tok.value
+        symbol_table = context.symbol_table
+        local_slot = node.local_slot
+
+        if local_slot is not None and symbol_table.values[local_slot] is not None:
+            value = symbol_table.values[local_slot]
+        else:
+            value = symbol_table.lookup(var_name, local_slot, node.global_slot)
+
+        if not value:
+            raise RTErrorException(RTError(
+                node.pos_start, node.pos_end,
+                f"'{var_name}' is not defined",
+                context
+            ))
+
+        return value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
+
+    def visit_VarAssignNode(self, node, context):
+        value = self.visit(node.value_node, context)
+
+        if node.slot is None:
+            context.symbol_table.set(node.var_name_tok.value, value)
+        else:
+            context.symbol_table.values[node.slot] = value
+
+        return value
+
+    def visit_BinOpNode(self, node, context):
+        left = self.visit(node.left_node, context)
+        right = self.visit(node.right_node, context)
+
+        if type(left) is not node.left_type or type(right) is not node.right_type:
+            node.left_type = type(left)
+            node.right_type = type(right)
+            node.cached_op = specialised_operation(node.method_name, node.left_type, node.right_type)
+
+        result = node.cached_op(left, right)
+
+        if result is None:
+            raise RTErrorException(locate_operation_error(
+                left, node.method_name, right,
+                (node.left_node.pos_start, node.left_node.pos_end),
+                (node.right_node.pos_start, node.right_node.pos_end),
+                context
+            ))
+
+        return result
+
+    def visit_UnaryOpNode(self, node, context):
+        number = self.visit(node.node, context)
+
+        if node.method_name == 'multed_by':
+            if type(number) is Number:
+                return make_number(number.value * -1)
+
+            result, error = number.multed_by(Number.minus_one)
+
+            if error:
+                number = number.located(node.node.pos_start, node.node.pos_end, context)
+                raise RTErrorException(number.multed_by(Number.minus_one)[1])
+
+            return result
+        elif node.method_name == 'notted':
+            return number.notted()[0]
+
+        return number
+
+    def visit_IfNode(self, node, context):
+        for condition, expr, should_return_null in node.cases:
+            condition_value = self.visit(condition, context)
+
+            if condition_value.is_true():
+                expr_value = self.visit(expr, context)
+                return Number.null if should_return_null else expr_value
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            expr_value = self.visit(expr, context)
+            return Number.null if should_return_null else expr_value
+
+        return Number.null
+
+    def visit_ForNode(self, node, context):
+        elements = None if node.should_return_null else []
+
+        start_value = self.visit(node.start_value_node, context)
+        end_value = self.visit(node.end_value_node, context)
+
+        if node.step_value_node:
+            step_value = self.visit(node.step_value_node, context)
+        else:
+            step_value = Number.true
+
+        symbol_table = context.symbol_table
+        var_name = node.var_name_tok.value
+        var_slot = node.var_slot
+
+        for i in loop_range(start_value.value, end_value.value, step_value.value):
+            symbol_table.assign(var_name, var_slot, make_number(i))
+
+            try:
+                value = self.visit(node.body_node, context)
+            except ContinueException:
+                continue
+            except BreakException:
+                break
+
+            if elements is not None:
+                elements.append(value)
+
+        return (
+            Number.null if elements is None else
+            List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
+        )
+
+    def visit_WhileNode(self, node, context):
+        elements = None if node.should_return_null else []
+
+        while True:
+            condition = self.visit(node.condition_node, context)
+
+            if not condition.is_true():
+                break
+
+            try:
+                value = self.visit(node.body_node, context)
+            except ContinueException:
+                continue
+            except BreakException:
+                break
+
+            if elements is not None:
+                elements.append(value)
+
+        return (
+            Number.null if elements is None else
+            List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
+        )
+
+    def visit_FuncDefNode(self, node, context):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        body_node = node.body_node
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        func_value = Function(func_name, body_node, arg_names, node.should_auto_return, node.scope).set_context(
+            context).set_pos(node.pos_start, node.pos_end)
+
+        if node.var_name_tok:
+            context.symbol_table.assign(func_name, node.slot, func_value)
+
+        return func_value
+
+    def visit_CallNode(self, node, context):
+        value_to_call = self.visit(node.node_to_call, context)
+        value_to_call = value_to_call.located(node.pos_start, node.pos_end, value_to_call.context or context)
+
+        args = [self.visit(arg_node, context) for arg_node in node.arg_nodes]
+
+        if type(value_to_call) is Function:
+            if node.is_tail:
+                return TailCall(value_to_call, args)
+
+            return_value = value_to_call.call(args)
+        else:
+            return_value = self.call_value(value_to_call, args)
+
+        return return_value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
+
+    def call_value(self, value_to_call, args):
+        # Calls anything other than a Function: built-in, memoised and
+        # compiled functions, and values that cannot be called at all.
+        return value_to_call.execute(args).unwrap()
+
+    def visit_ReturnNode(self, node, context):
+        if node.node_to_return:
+            value = self.visit(node.node_to_return, context)
+        else:
+            value = Number.null
+
+        raise ReturnException(value)
+
+    def visit_ContinueNode(self, node, context):
+        raise CONTINUE_EXCEPTION.with_traceback(None)
+
+    def visit_BreakNode(self, node, context):
+        raise BREAK_EXCEPTION.with_traceback(None)
+
+
+interpreter = Interpreter()
+
+#######################################
+# OPTIMIZER
+#######################################
+
+MAX_FOLDED_POW_BITS = 4096
+MAX_FOLDED_STRING_LENGTH = 4096
+
+
+class Optimizer:
+    # Rewrites a parsed program before it runs. Literal arithmetic is folded
+    # by running the same Value methods the interpreter would, so a folded
+    # node produces an identical value at identical positions. Anything that
+    # would fail at runtime is left in place to fail there.
+    def optimize(self, node):
+        method_name = f'optimize_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_optimize_method)
+        return method(node)
+
+    def no_optimize_method(self, node):
+        raise Exception(f'No optimize_{type(node).__name__} method defined')
+
+    ###################################
+
+    def optimize_NumberNode(self, node):
+        return node
+
+    def optimize_StringNode(self, node):
+        return node
+
+    def optimize_VarAccessNode(self, node):
+        return node
+
+    def optimize_ContinueNode(self, node):
+        return node
+
+    def optimize_BreakNode(self, node):
+        return node
+
+    def optimize_ListNode(self, node):
+        node.element_nodes = [self.optimize(element_node) for element_node in node.element_nodes]
+        return node
+
+    def optimize_VarAssignNode(self, node):
+        node.value_node = self.optimize(node.value_node)
+        return node
+
+    def optimize_BinOpNode(self, node):
+        node.left_node = self.optimize(node.left_node)
+        node.right_node = self.optimize(node.right_node)
+
+        left = self.literal_value(node.left_node)
+        right = self.literal_value(node.right_node)
+        if left is None or right is None:
+            return node
+
+        if not self.is_small_result(node.method_name, left, right):
+            return node
+
+        try:
+            result, error = getattr(left, node.method_name)(right)
+        except Exception:
+            return node
+
+        if error:
+            return node
+
+        return self.literal_node(result, node.pos_start, node.pos_end) or node
+
+    def optimize_UnaryOpNode(self, node):
+        node.node = self.optimize(node.node)
+
+        operand = self.literal_value(node.node)
+        if operand is None:
+            return node
+
+        try:
+            if node.method_name == 'multed_by':
+                result, error = operand.multed_by(Number.minus_one)
+            elif node.method_name == 'notted':
+                result, error = operand.notted()
+            else:
+                result, error = operand, None
+        except Exception:
+            return node
+
+        if error:
+            return node
+
+        return self.literal_node(result, node.pos_start, node.pos_end) or node
+
+    def optimize_IfNode(self, node):
+        # Branches that can never be taken are dropped without being folded.
+        all_cases = []
+        cases = []
+        else_case = None
+
+        for condition, expr, should_return_null in node.cases:
+            condition = self.optimize(condition)
+            condition_value = self.literal_value(condition)
+
+            if condition_value is None:
+                case = (condition, self.optimize(expr), should_return_null)
+                cases.append(case)
+            elif condition_value.is_true():
+                # Later cases and the ELSE branch can never be reached.
+                case = (condition, self.optimize(expr), should_return_null)
+                else_case = (case[1], should_return_null)
+            else:
+                case = (condition, expr, should_return_null)
+
+            all_cases.append(case)
+            if else_case: break
+
+        if else_case is None and node.else_case:
+            expr, should_return_null = node.else_case
+            else_case = (self.optimize(expr), should_return_null)
+
+        if len(cases) == 0 and else_case and not else_case[1]:
+            return else_case[0]
+
+        if len(cases) == 0:
+            # Keep one case so the IF stays in place: the interpreter returns
+            # the shared NULL value for it, which no literal node reproduces.
+            cases = all_cases[:1]
+
+        node.cases = cases
+        node.else_case = else_case
+        return node
+
+    def optimize_ForNode(self, node):
+        node.start_value_node = self.optimize(node.start_value_node)
+        node.end_value_node = self.optimize(node.end_value_node)
+        if node.step_value_node:
+            node.step_value_node = self.optimize(node.step_value_node)
+
+        start_value = self.literal_value(node.start_value_node)
+        end_value = self.literal_value(node.end_value_node)
+        step_value = self.literal_value(node.step_value_node) if node.step_value_node else Number.true
+
+        if not all(isinstance(value, Number) for value in (start_value, end_value, step_value)):
+            node.body_node = self.optimize(node.body_node)
+            return node
+
+        # A loop over constant bounds that never runs only builds an empty list.
+        if step_value.value >= 0:
+            never_runs = not start_value.value < end_value.value
+        else:
+            never_runs = not start_value.value > end_value.value
+
+        if never_runs and not node.should_return_null:
+            return ListNode([], node.pos_start, node.pos_end)
+
+        if not never_runs:
+            node.body_node = self.optimize(node.body_node)
+
+        return node
+
+    def optimize_WhileNode(self, node):
+        node.condition_node = self.optimize(node.condition_node)
+
+        condition_value = self.literal_value(node.condition_node)
+        never_runs = condition_value is not None and not condition_value.is_true()
+
+        if never_runs and not node.should_return_null:
+            return ListNode([], node.pos_start, node.pos_end)
+
+        if not never_runs:
+            node.body_node = self.optimize(node.body_node)
+
+        return node
+
+    def optimize_FuncDefNode(self, node):
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_CallNode(self, node):
+        node.node_to_call = self.optimize(node.node_to_call)
+        node.arg_nodes = [self.optimize(arg_node) for arg_node in node.arg_nodes]
+        return node
+
+    def optimize_ReturnNode(self, node):
+        if node.node_to_return:
+            node.node_to_return = self.optimize(node.node_to_return)
+        return node
+
+    ###################################
+
+    def literal_value(self, node):
+        if isinstance(node, NumberNode):
+            return make_number(node.tok.value)
+        if isinstance(node, StringNode):
+            return String(node.tok.value)
+        return None
+
+    def literal_node(self, value, pos_start, pos_end):
+        if isinstance(value, Number):
+            tok_type = TT_INT if isinstance(value.value, int) else TT_FLOAT
+            return NumberNode(Token(tok_type, value.value, pos_start, pos_end))
+
+        if isinstance(value, String) and len(value.value) <= MAX_FOLDED_STRING_LENGTH:
+            return StringNode(Token(TT_STRING, value.value, pos_start, pos_end))
+
+        return None
+
+    def is_small_result(self, method_name, left, right):
+        # Folding must not stall on something like 9 ^ 9 ^ 9 or "ab" * 10 ^ 8,
+        # so the size of a power or a string repeat is estimated before it is
+        # computed. Only integer powers and repeats can grow without bound.
+        if not isinstance(right, Number) or type(right.value) is not int:
+            return True
+
+        if method_name == 'powed_by' and isinstance(left, Number) and type(left.value) is int:
+            if right.value <= 0 or left.value in (0, 1, -1):
+                return True
+            return abs(left.value).bit_length() * right.value <= MAX_FOLDED_POW_BITS
+
+        if method_name == 'multed_by' and isinstance(left, String):
+            return len(left.value) * right.value <= MAX_FOLDED_STRING_LENGTH
+
+        return True
+
+
+#######################################
+# RESOLVER
+#######################################
+
+class Resolver:
+    # Gives every name a slot before a program runs. Names bound in a
+    # function body (its arguments, VAR and FOR variables and named FUNs) get
+    # a slot in that function's frames, top-level names get a slot in the
+    # global table, and a function reading a name it never binds is pointed
+    # at the global slot for it.
+    def __init__(self, global_table):
+        self.global_table = global_table
+        self.reads = None
+
+    def resolve_program(self, node):
+        self.resolve(node, None)
+
+    def resolve(self, node, scope):
+        method_name = f'resolve_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_resolve_method)
+        method(node, scope)
+
+    def no_resolve_method(self, node, scope):
+        raise Exception(f'No resolve_{type(node).__name__} method defined')
+
+    def bind(self, name, scope):
+        if scope is None:
+            return self.global_table.define(name)
+
+        self.global_table.local_names.add(name)
+        return scope.define(name)
+
+    ###################################
+
+    def resolve_NumberNode(self, node, scope):
+        pass
+
+    def resolve_StringNode(self, node, scope):
+        pass
+
+    def resolve_ContinueNode(self, node, scope):
+        pass
+
+    def resolve_BreakNode(self, node, scope):
+        pass
+
+    def resolve_ListNode(self, node, scope):
+        for element_node in node.element_nodes:
+            self.resolve(element_node, scope)
+
+    def resolve_VarAccessNode(self, node, scope):
+        if scope is None:
+            node.local_slot = self.global_table.define(node.var_name_tok.value)
+            node.global_slot = None
+        else:
+            # A function's reads are resolved once its whole body has been
+            # seen, so a read ahead of the VAR that binds it is still local.
+            self.reads.append(node)
+
+    def resolve_VarAssignNode(self, node, scope):
+        self.resolve(node.value_node, scope)
+        node.slot = self.bind(node.var_name_tok.value, scope)
+
+    def resolve_BinOpNode(self, node, scope):
+        self.resolve(node.left_node, scope)
+        self.resolve(node.right_node, scope)
+
+    def resolve_UnaryOpNode(self, node, scope):
+        self.resolve(node.node, scope)
+
+    def resolve_IfNode(self, node, scope):
+        for condition, expr, _ in node.cases:
+            self.resolve(condition, scope)
+            self.resolve(expr, scope)
+
+        if node.else_case:
+            self.resolve(node.else_case[0], scope)
+
+    def resolve_ForNode(self, node, scope):
+        self.resolve(node.start_value_node, scope)
+        self.resolve(node.end_value_node, scope)
+        if node.step_value_node:
+            self.resolve(node.step_value_node, scope)
+
+        node.var_slot = self.bind(node.var_name_tok.value, scope)
+        self.resolve(node.body_node, scope)
+
+    def resolve_WhileNode(self, node, scope):
+        self.resolve(node.condition_node, scope)
+        self.resolve(node.body_node, scope)
+
+    def resolve_FuncDefNode(self, node, scope):
+        if node.var_name_tok:
+            node.slot = self.bind(node.var_name_tok.value, scope)
+
+        func_scope = Scope()
+        for arg_name_tok in node.arg_name_toks:
+            self.bind(arg_name_tok.value, func_scope)
+
+        outer_reads = self.reads
+        self.reads = []
+        self.resolve(node.body_node, func_scope)
+
+        for read_node in self.reads:
+            var_name = read_node.var_name_tok.value
+            read_node.local_slot = func_scope.slots.get(var_name)
+            read_node.global_slot = None if read_node.local_slot is not None else self.global_table.define(var_name)
+
+        self.reads = outer_reads
+        node.scope = func_scope
+        self.mark_tail_calls(node.body_node, node.should_auto_return)
+
+    def mark_tail_calls(self, node, is_value):
+        # Marks the calls whose value the function returns as it is, so they
+        # can take over the caller's frame. is_value says whether the node's
+        # own value is what the function returns. Calls inside a loop are
+        # left alone, as a BREAK or CONTINUE in the callee still has to reach
+        # that loop.
+        if isinstance(node, CallNode):
+            node.is_tail = is_value
+        elif isinstance(node, ReturnNode):
+            if node.node_to_return:
+                self.mark_tail_calls(node.node_to_return, True)
+        elif isinstance(node, IfNode):
+            for _, expr, should_return_null in node.cases:
+                self.mark_tail_calls(expr, is_value and not should_return_null)
+
+            if node.else_case:
+                expr, should_return_null = node.else_case
+                self.mark_tail_calls(expr, is_value and not should_return_null)
+        elif isinstance(node, ListNode) and not is_value:
+            for element_node in node.element_nodes:
+                self.mark_tail_calls(element_node, False)
+
+    def resolve_CallNode(self, node, scope):
+        self.resolve(node.node_to_call, scope)
+
+        for arg_node in node.arg_nodes:
+            self.resolve(arg_node, scope)
+
+    def resolve_ReturnNode(self, node, scope):
+        if node.node_to_return:
+            self.resolve(node.node_to_return, scope)
+
+
+#######################################
+# BYTECODE
+#######################################
+
+OP_LOAD_NUMBER = 0
+OP_LOAD_STRING = 1
+OP_LOAD_NULL = 2
+OP_LOAD_NAME = 3
+OP_STORE_NAME = 4
+OP_BINARY_OP = 5
+OP_UNARY_MINUS = 6
+OP_UNARY_NOT = 7
+OP_BUILD_LIST = 8
+OP_POP = 9
+OP_JUMP = 10
+OP_POP_JUMP_IF_FALSE = 11
+OP_MAKE_FUNCTION = 12
+OP_CALL = 13
+OP_RETURN = 14
+OP_END = 15
+OP_SETUP_FOR = 16
+OP_SETUP_WHILE = 17
+OP_FOR_ITER = 18
+OP_LOOP_APPEND = 19
+OP_END_LOOP = 20
+OP_BREAK = 21
+OP_CONTINUE = 22
+OP_TAIL_CALL = 23
+
+BINARY_OP_METHODS = {
+    TT_PLUS: 'added_to',
+    TT_MINUS: 'subbed_by',
+    TT_MUL: 'multed_by',
+    TT_DIV: 'dived_by',
+    TT_POW: 'powed_by',
+    TT_EE: 'get_comparison_eq',
+    TT_NE: 'get_comparison_ne',
+    TT_LT: 'get_comparison_lt',
+    TT_GT: 'get_comparison_gt',
+    TT_LTE: 'get_comparison_lte',
+    TT_GTE: 'get_comparison_gte',
+    'AND': 'anded_by',
+    'OR': 'ored_by',
+}
+
+UNARY_OP_METHODS = {
+    TT_MINUS: 'multed_by',
+    'NOT': 'notted',
+}
+
+
+class CodeObject:
+    # Instructions are stored flat as [op, arg, op, arg, ...], so every
+    # instruction is two slots wide and jump targets are even indices.
+    def __init__(self, name, arg_names=None, should_auto_return=False):
+        self.name = name
+        self.arg_names = arg_names or []
+        self.should_auto_return = should_auto_return
+        self.instructions = []
+
+    def emit(self, op, arg=None):
+        self.instructions.append(op)
+        self.instructions.append(arg)
+        return len(self.instructions) - 1
+
+    def patch(self, arg_idx, arg):
+        self.instructions[arg_idx] = arg
+
+    def label(self):
+        return len(self.instructions)
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+
+#######################################
+# COMPILER
+#######################################
+
+class Compiler:
+    def compile_program(self, node):
+        code = CodeObject('<program>', should_auto_return=True)
+        self.compile(node, code)
+        code.emit(OP_END)
+        return code
+
+    def compile(self, node, code):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_compile_method)
+        method(node, code)
+
+    def no_compile_method(self, node, code):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    ###################################
+
+    def compile_NumberNode(self, node, code):
+        code.emit(OP_LOAD_NUMBER, make_number(node.tok.value))
+
+    def compile_StringNode(self, node, code):
+        code.emit(OP_LOAD_STRING, String(node.tok.value))
+
+    def compile_ListNode(self, node, code):
+        for element_node in node.element_nodes:
+            self.compile(element_node, code)
+
+        code.emit(OP_BUILD_LIST, (len(node.element_nodes), node.pos_start, node.pos_end))
+
+    def compile_VarAccessNode(self, node, code):
+        code.emit(OP_LOAD_NAME, (
+            node.var_name_tok.value, node.local_slot, node.global_slot, node.pos_start, node.pos_end
+        ))
+
+    def compile_VarAssignNode(self, node, code):
+        self.compile(node.value_node, code)
+        code.emit(OP_STORE_NAME, (node.var_name_tok.value, node.slot))
+
+    def compile_BinOpNode(self, node, code):
+        self.compile(node.left_node, code)
+        self.compile(node.right_node, code)
+
+        code.emit(OP_BINARY_OP, (
+            node.method_name, (node.left_node.pos_start, node.left_node.pos_end),
+            (node.right_node.pos_start, node.right_node.pos_end)
+        ))
+
+    def compile_UnaryOpNode(self, node, code):
+        self.compile(node.node, code)
+
+        if node.op_tok.type == TT_MINUS:
+            code.emit(OP_UNARY_MINUS, (node.node.pos_start, node.node.pos_end))
+        elif node.op_tok.matches(TT_KEYWORD, 'NOT'):
+            code.emit(OP_UNARY_NOT)
+
+    def compile_IfNode(self, node, code):
+        end_jumps = []
+
+        for condition, expr, should_return_null in node.cases:
+            self.compile(condition, code)
+            next_case_jump = code.emit(OP_POP_JUMP_IF_FALSE)
+            self.compile_case_body(expr, should_return_null, code)
+            end_jumps.append(code.emit(OP_JUMP))
+            code.patch(next_case_jump, code.label())
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            self.compile_case_body(expr, should_return_null, code)
+        else:
+            code.emit(OP_LOAD_NULL)
+
+        for end_jump in end_jumps:
+            code.patch(end_jump, code.label())
+
+    def compile_case_body(self, expr, should_return_null, code):
+        self.compile(expr, code)
+
+        if should_return_null:
+            code.emit(OP_POP)
+            code.emit(OP_LOAD_NULL)
+
+    def compile_ForNode(self, node, code):
+        self.compile(node.start_value_node, code)
+        self.compile(node.end_value_node, code)
+
+        if node.step_value_node:
+            self.compile(node.step_value_node, code)
+        else:
+            code.emit(OP_LOAD_NUMBER, Number.true)
+
+        setup = code.emit(OP_SETUP_FOR)
+        head = code.label()
+        exit_jump = code.emit(OP_FOR_ITER)
+        self.compile(node.body_node, code)
+        code.emit(OP_POP if node.should_return_null else OP_LOOP_APPEND)
+        code.emit(OP_JUMP, head)
+
+        end = code.label()
+        code.patch(exit_jump, end)
+        code.patch(setup, ((node.var_name_tok.value, node.var_slot), not node.should_return_null, head, end))
+        code.emit(OP_END_LOOP, (node.pos_start, node.pos_end))
+
+    def compile_WhileNode(self, node, code):
+        setup = code.emit(OP_SETUP_WHILE)
+        head = code.label()
+        self.compile(node.condition_node, code)
+        exit_jump = code.emit(OP_POP_JUMP_IF_FALSE)
+        self.compile(node.body_node, code)
+        code.emit(OP_POP if node.should_return_null else OP_LOOP_APPEND)
+        code.emit(OP_JUMP, head)
+
+        end = code.label()
+        code.patch(exit_jump, end)
+        code.patch(setup, (not node.should_return_null, head, end))
+        code.emit(OP_END_LOOP, (node.pos_start, node.pos_end))
+
+    def compile_FuncDefNode(self, node, code):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+
+        func_code = CodeObject(func_name or '<anonymous>', arg_names, node.should_auto_return)
+        self.compile(node.body_node, func_code)
+        func_code.emit(OP_END)
+
+        code.emit(OP_MAKE_FUNCTION, (
+            func_name, node.slot, node.scope, node.body_node, func_code, node.pos_start, node.pos_end
+        ))
+
+    def compile_CallNode(self, node, code):
+        self.compile(node.node_to_call, code)
+
+        for arg_node in node.arg_nodes:
+            self.compile(arg_node, code)
+
+        code.emit(OP_TAIL_CALL if node.is_tail else OP_CALL, (len(node.arg_nodes), node.pos_start, node.pos_end))
+
+    def compile_ReturnNode(self, node, code):
+        if node.node_to_return:
+            self.compile(node.node_to_return, code)
+        else:
+            code.emit(OP_LOAD_NULL)
+
+        code.emit(OP_RETURN)
+
+    def compile_ContinueNode(self, node, code):
+        code.emit(OP_CONTINUE)
+
+    def compile_BreakNode(self, node, code):
+        code.emit(OP_BREAK)
+
+
+#######################################
+# VIRTUAL MACHINE
+#######################################
+
+class VirtualMachine:
+    # Calls between compiled functions push a frame onto self.frames instead
+    # of recursing in Python. A frame is saved as
+    # (code, instructions, pc, stack, blocks, context, call_pos).
+    #
+    # Loop blocks are lists: [stack_base, head, end, elements, ...] with
+    # FOR loops adding [(var_name, var_slot), i, end_value, step_value].
+    def run(self, code, context):
+        frames = []
+        instructions = code.instructions
+        pc = 0
+        stack = []
+        blocks = []
+
+        while True:
+            op = instructions[pc]
+            arg = instructions[pc + 1]
+            pc += 2
+
+            if op == OP_LOAD_NAME:
+                var_name, local_slot, global_slot, pos_start, pos_end = arg
+                values = context.symbol_table.values
+
+                if local_slot is not None and values[local_slot] is not None:
+                    value = values[local_slot]
+                else:
+                    value = context.symbol_table.lookup(var_name, local_slot, global_slot)
+
+                if not value:
+                    return RTResult().failure(RTError(
+                        pos_start, pos_end,
+                        f"'{var_name}' is not defined",
+                        context
+                    ))
+
+                stack.append(value.copy().set_pos(pos_start, pos_end).set_context(context))
+
+            elif op == OP_LOAD_NUMBER:
+                stack.append(arg)
+
+            elif op == OP_BINARY_OP:
+                right = stack.pop()
+                left = stack.pop()
+                result, error = getattr(left, arg[0])(right)
+                if error:
+                    return RTResult().failure(locate_operation_error(left, arg[0], right, arg[1], arg[2], context))
+                stack.append(result)
+
+            elif op == OP_STORE_NAME:
+                context.symbol_table.assign(arg[0], arg[1], stack[-1])
+
+            elif op == OP_POP_JUMP_IF_FALSE:
+                if not stack.pop().is_true():
+                    pc = arg
+
+            elif op == OP_JUMP:
+                pc = arg
+
+            elif op == OP_FOR_ITER:
+                block = blocks[-1]
+                i = next(block[5], None)
+
+                if i is not None:
+                    context.symbol_table.assign(block[4][0], block[4][1], make_number(i))
+                else:
+                    pc = arg
+
+            elif op == OP_LOOP_APPEND:
+                blocks[-1][3].append(stack.pop())
+
+            elif op == OP_POP:
+                stack.pop()
+
+            elif op == OP_LOAD_NULL:
+                stack.append(Number.null)
+
+            elif op == OP_LOAD_STRING:
+                stack.append(arg)
+
+            elif op == OP_CALL or op == OP_TAIL_CALL:
+                arg_count, pos_start, pos_end = arg
+                args = stack[len(stack) - arg_count:]
+                del stack[len(stack) - arg_count:]
+                value_to_call = stack.pop()
+                value_to_call = value_to_call.located(pos_start, pos_end, value_to_call.context or context)
+
+                if type(value_to_call) is CompiledFunction:
+                    # A tail call takes over the current frame, which has
+                    # nothing left to do but return the callee's value. The
+                    # outermost frame is kept, as whoever started this run
+                    # reads the result as its own function's.
+                    is_tail_call = op == OP_TAIL_CALL and frames
+
+                    if is_tail_call:
+                        exec_ctx = value_to_call.generate_tail_context(context, value_to_call.scope)
+                    else:
+                        exec_ctx = value_to_call.generate_new_context(value_to_call.scope)
+
+                    res = value_to_call.check_and_populate_args(value_to_call.arg_names, args, exec_ctx)
+                    if res.error: return res
+
+                    if not is_tail_call:
+                        if len(frames) >= BASIC_MAX_CALL_DEPTH:
+                            return RTResult().failure(RTError(
+                                pos_start, pos_end,
+                                'Maximum recursion depth exceeded',
+                                context
+                            ))
+
+                        frames.append((code, instructions, pc, stack, blocks, context, arg))
+
+                    code = value_to_call.code
+                    instructions = code.instructions
+                    pc = 0
+                    stack = []
+                    blocks = []
+                    context = exec_ctx
+                    continue
+
+                res = value_to_call.execute(args)
+                if res.error: return res
+
+                if res.loop_should_break or res.loop_should_continue:
+                    signal = OP_BREAK if res.loop_should_break else OP_CONTINUE
+                    frame_state = self.unwind_loop_signal(signal, frames, code, instructions, stack, blocks, context)
+                    if isinstance(frame_state, RTResult): return frame_state
+                    code, instructions, pc, stack, blocks, context = frame_state
+                    continue
+
+                stack.append(res.value.copy().set_pos(pos_start, pos_end).set_context(context))
+
+            elif op == OP_END or op == OP_RETURN:
+                value = stack.pop()
+
+                if not frames:
+                    if op == OP_RETURN:
+                        return RTResult().success_return(value)
+                    return RTResult().success(value)
+
+                if op == OP_END and not code.should_auto_return:
+                    value = Number.null
+
+                code, instructions, pc, stack, blocks, context, call_arg = frames.pop()
+                stack.append(value.copy().set_pos(call_arg[1], call_arg[2]).set_context(context))
+
+            elif op == OP_BUILD_LIST:
+                element_count, pos_start, pos_end = arg
+                elements = stack[len(stack) - element_count:]
+                del stack[len(stack) - element_count:]
+                stack.append(List(elements).set_context(context).set_pos(pos_start, pos_end))
+
+            elif op == OP_SETUP_FOR:
+                var, should_collect, head, end = arg
+                step_value = stack.pop()
+                end_value = stack.pop()
+                start_value = stack.pop()
+                blocks.append([
+                    len(stack), head, end, [] if should_collect else None,
+                    var, iter(loop_range(start_value.value, end_value.value, step_value.value))
+                ])
+
+            elif op == OP_SETUP_WHILE:
+                should_collect, head, end = arg
+                blocks.append([len(stack), head, end, [] if should_collect else None])
+
+            elif op == OP_END_LOOP:
+                elements = blocks.pop()[3]
+
+                if elements is None:
+                    stack.append(Number.null)
+                else:
+                    stack.append(List(elements).set_context(context).set_pos(arg[0], arg[1]))
+
+            elif op == OP_BREAK or op == OP_CONTINUE:
+                frame_state = self.unwind_loop_signal(op, frames, code, instructions, stack, blocks, context)
+                if isinstance(frame_state, RTResult): return frame_state
+                code, instructions, pc, stack, blocks, context = frame_state
+
+            elif op == OP_UNARY_MINUS:
+                number = stack.pop()
+                result, error = number.multed_by(Number.minus_one)
+                if error:
+                    number = number.located(arg[0], arg[1], context)
+                    return RTResult().failure(number.multed_by(Number.minus_one)[1])
+                stack.append(result)
+
+            elif op == OP_UNARY_NOT:
+                stack.append(stack.pop().notted()[0])
+
+            elif op == OP_MAKE_FUNCTION:
+                func_name, slot, scope, body_node, func_code, pos_start, pos_end = arg
+                func_value = CompiledFunction(
+                    func_name, body_node, func_code.arg_names, func_code.should_auto_return, func_code, scope
+                ).set_context(context).set_pos(pos_start, pos_end)
+
+                if func_name:
+                    context.symbol_table.assign(func_name, slot, func_value)
+
+                stack.append(func_value)
+
+            else:
+                raise Exception(f'Unknown opcode {op}')
+
+    def unwind_loop_signal(self, signal, frames, code, instructions, stack, blocks, context):
+        # BREAK and CONTINUE apply to the innermost loop, even when that loop
+        # is in a calling function (matching the tree-walking interpreter).
+        while not blocks:
+            if not frames:
+                if signal == OP_BREAK:
+                    return RTResult().success_break()
+                return RTResult().success_continue()
+
+            code, instructions, _, stack, blocks, context, _ = frames.pop()
+
+        block = blocks[-1]
+        del stack[block[0]:]
+        pc = block[2] if signal == OP_BREAK else block[1]
+        return code, instructions, pc, stack, blocks, context
+
+
+#######################################
+# PYTHON TRANSPILER
+#######################################
+
+# The fast path of each binary operation on two numbers, as Python source
+# taking the operands' names. It has to give the same value as the Number
+# method; anything else goes through python_operate.
+PYTHON_NUMBER_OPERATIONS = {
+    'added_to': 'make_number({0}.value + {1}.value)',
+    'subbed_by': 'make_number({0}.value - {1}.value)',
+    'multed_by': 'make_number({0}.value * {1}.value)',
+    'powed_by': 'make_number({0}.value ** {1}.value)',
+    'get_comparison_eq': 'TRUE if {0}.value == {1}.value else FALSE',
+    'get_comparison_ne': 'TRUE if {0}.value != {1}.value else FALSE',
+    'get_comparison_lt': 'TRUE if {0}.value < {1}.value else FALSE',
+    'get_comparison_gt': 'TRUE if {0}.value > {1}.value else FALSE',
+    'get_comparison_lte': 'TRUE if {0}.value <= {1}.value else FALSE',
+    'get_comparison_gte': 'TRUE if {0}.value >= {1}.value else FALSE',
+    'anded_by': 'make_number(int({0}.value and {1}.value))',
+    'ored_by': 'make_number(int({0}.value or {1}.value))',
+}
+
+PYTHON_CODE_CACHE_SIZE = 256
+
+
+class PythonBlock:
+    # The lines of one generated Python function, and the node each line
+    # that can fail reports its error at (by index into lines).
+    def __init__(self, header):
+        self.lines = [header]
+        self.line_nodes = {}
+
+
+class Transpiler:
+    # Turns a resolved program into Python source. Every node is lowered to
+    # statements that leave its value in a temporary, so evaluation order is
+    # the interpreter's and AND and OR still evaluate both sides. Each
+    # function body becomes a top-level Python function taking the call's
+    # context and arguments; variables live in the same symbol tables the
+    # interpreter uses, so dynamic scoping and tail calls behave the same.
+    #
+    # Nodes that are needed on the normal path (calls and function
+    # definitions) are referred to as N[index]. A failing operation only
+    # needs its node to report an error, so instead of being passed one it
+    # looks up the line it was called from in line_map.
+    def transpile_program(self, node):
+        self.blocks = []
+        self.nodes = []
+        self.constants = {}
+        self.function_count = 0
+
+        self.begin_block('def program(context):', False)
+        value = self.transpile(node, True)
+        self.emit(f'return {value}')
+        self.blocks.append(self.block)
+
+        lines = [f'{name} = {source}' for source, name in self.constants.items()]
+        line_map = {}
+
+        for block in self.blocks:
+            for index, line in enumerate(block.lines):
+                lines.append(line)
+                if index in block.line_nodes:
+                    line_map[len(lines)] = block.line_nodes[index]
+
+        return '\n'.join(lines) + '\n', line_map, self.nodes
+
+    def transpile(self, node, want_value):
+        # Emits the node's code and returns the name holding its value (or
+        # 'NULL' when want_value is false and the value is never used).
+        method_name = f'transpile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_transpile_method)
+        return method(node, want_value)
+
+    def no_transpile_method(self, node, want_value):
+        raise Exception(f'No transpile_{type(node).__name__} method defined')
+
+    def begin_block(self, header, in_function):
+        self.block = PythonBlock(header)
+        self.indent = 1
+        self.temp_count = 0
+        self.in_function = in_function
+        self.in_loop_body = False
+        self.emit('values = context.symbol_table.values')
+
+    def emit(self, line, node=None):
+        if node is not None:
+            self.block.line_nodes[len(self.block.lines)] = node
+        self.block.lines.append('    ' * self.indent + line)
+
+    def emit_body(self, node, want_value):
+        # Emits the node one level deeper, keeping the block non-empty.
+        self.indent += 1
+        line_count = len(self.block.lines)
+        value = self.transpile(node, want_value)
+        if len(self.block.lines) == line_count:
+            self.emit('pass')
+        self.indent -= 1
+        return value
+
+    def temp(self):
+        self.temp_count += 1
+        return f't{self.temp_count}'
+
+    def constant(self, source):
+        if source not in self.constants:
+            self.constants[source] = f'k{len(self.constants)}'
+        return self.constants[source]
+
+    def node_ref(self, node):
+        self.nodes.append(node)
+        return f'N[{len(self.nodes) - 1}]'
+
+    def truth(self, name):
+        return f'({name}.value != 0 if type({name}) is Number else {name}.is_true())'
+
+    ###################################
+
+    def transpile_NumberNode(self, node, want_value):
+        return self.constant(f'make_number({node.tok.value!r})')
+
+    def transpile_StringNode(self, node, want_value):
+        return self.constant(f'String({node.tok.value!r})')
+
+    def transpile_ListNode(self, node, want_value):
+        elements = [self.transpile(element_node, want_value) for element_node in node.element_nodes]
+
+        if not want_value:
+            return 'NULL'
+
+        value = self.temp()
+        self.emit(f'{value} = List([{", ".join(elements)}])')
+        return value
+
+    def transpile_VarAccessNode(self, node, want_value):
+        var_name = repr(node.var_name_tok.value)
+        value = self.temp()
+
+        if node.local_slot is not None:
+            self.emit(f'{value} = values[{node.local_slot}]')
+        elif node.global_slot is not None:
+            self.emit(f'{value} = None if {var_name} in local_names else gvalues[{node.global_slot}]')
+        else:
+            self.emit(f'{value} = None')
+
+        self.emit(f'if {value} is None: '
+                  f'{value} = python_load(context, {var_name}, {node.local_slot}, {node.global_slot})', node)
+        return value
+
+    def transpile_VarAssignNode(self, node, want_value):
+        value = self.transpile(node.value_node, True)
+
+        if node.slot is None:
+            self.emit(f'context.symbol_table.set({node.var_name_tok.value!r}, {value})')
+        else:
+            self.emit(f'values[{node.slot}] = {value}')
+
+        return value
+
+    def transpile_BinOpNode(self, node, want_value):
+        left = self.transpile(node.left_node, True)
+        right = self.transpile(node.right_node, True)
+        method_name = node.method_name
+        value = self.temp()
+
+        if method_name == 'dived_by':
+            self.emit(f'if type({left}) is Number and type({right}) is Number and {right}.value != 0:')
+            self.emit(f'    {value} = Number({left}.value / {right}.value)')
+        else:
+            self.emit(f'if type({left}) is Number and type({right}) is Number:')
+            self.emit(f'    {value} = {PYTHON_NUMBER_OPERATIONS[method_name].format(left, right)}')
+
+        self.emit('else:')
+        self.emit(f'    {value} = python_operate({left}, {method_name!r}, {right}, context)', node)
+        return value
+
+    def transpile_UnaryOpNode(self, node, want_value):
+        operand = self.transpile(node.node, True)
 
-        for arg_node in node.arg_nodes:
-            args.append(res.register(self.visit(arg_node, context)))
-            if res.should_return(): return res
+        if node.op_tok.type == TT_MINUS:
+            value = self.temp()
+            self.emit(f'if type({operand}) is Number: {value} = make_number({operand}.value * -1)')
+            self.emit(f'else: {value} = python_negate({operand}, context)', node)
+            return value
+        elif node.op_tok.matches(TT_KEYWORD, 'NOT'):
+            value = self.temp()
+            self.emit(f'{value} = {operand}.notted()[0]')
+            return value
 
-        return_value = res.register(value_to_call.execute(args))
-        if res.should_return(): return res
-        return_value = return_value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
-        return res.success(return_value)
+        return operand
 
-    def visit_ReturnNode(self, node, context):
-        res = RTResult()
+    def transpile_IfNode(self, node, want_value):
+        value = self.temp() if want_value else None
+        depth = self.indent
 
-        if node.node_to_return:
-            value = res.register(self.visit(node.node_to_return, context))
-            if res.should_return(): return res
+        for condition, expr, should_return_null in node.cases:
+            condition_value = self.transpile(condition, True)
+            self.emit(f'if {self.truth(condition_value)}:')
+            self.transpile_case(expr, should_return_null, value)
+            self.emit('else:')
+            self.indent += 1
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            self.indent -= 1
+            self.transpile_case(expr, should_return_null, value)
+        elif value:
+            self.emit(f'{value} = NULL')
         else:
-            value = Number.null
+            self.emit('pass')
 
-        return res.success_return(value)
+        self.indent = depth
+        return value or 'NULL'
 
-    def visit_ContinueNode(self, node, context):
-        return RTResult().success_continue()
+    def transpile_case(self, expr, should_return_null, value):
+        if value is None or should_return_null:
+            self.emit_body(expr, False)
+            if value: self.emit(f'    {value} = NULL')
+        else:
+            self.emit(f'    {value} = {self.emit_body(expr, True)}')
+
+    def transpile_loop_body(self, node, elements):
+        # The body of a FOR or WHILE, where BREAK and CONTINUE (including
+        # ones raised by a function called from it) end the iteration.
+        self.emit('try:')
+        in_loop_body, self.in_loop_body = self.in_loop_body, True
+        value = self.emit_body(node, elements is not None)
+        self.in_loop_body = in_loop_body
+        self.emit('except ContinueException:')
+        self.emit('    continue')
+        self.emit('except BreakException:')
+        self.emit('    break')
+
+        if elements is not None:
+            self.emit(f'{elements}.append({value})')
+
+    def transpile_loop_value(self, elements):
+        if elements is None:
+            return 'NULL'
+
+        value = self.temp()
+        self.emit(f'{value} = List({elements})')
+        return value
 
-    def visit_BreakNode(self, node, context):
-        return RTResult().success_break()
+    def transpile_ForNode(self, node, want_value):
+        start_value = self.transpile(node.start_value_node, True)
+        end_value = self.transpile(node.end_value_node, True)
+        step_value = self.transpile(node.step_value_node, True) if node.step_value_node else 'TRUE'
+
+        elements = self.temp() if want_value and not node.should_return_null else None
+        if elements: self.emit(f'{elements} = []')
+
+        i = self.temp()
+        self.emit(f'for {i} in loop_range({start_value}.value, {end_value}.value, {step_value}.value):')
+        self.indent += 1
+
+        if node.var_slot is None:
+            self.emit(f'context.symbol_table.set({node.var_name_tok.value!r}, make_number({i}))')
+        else:
+            self.emit(f'values[{node.var_slot}] = make_number({i})')
+
+        self.transpile_loop_body(node.body_node, elements)
+        self.indent -= 1
+        return self.transpile_loop_value(elements)
+
+    def transpile_WhileNode(self, node, want_value):
+        elements = self.temp() if want_value and not node.should_return_null else None
+        if elements: self.emit(f'{elements} = []')
+
+        self.emit('while True:')
+        self.indent += 1
+
+        # A BREAK in the condition is not caught by this loop.
+        in_loop_body, self.in_loop_body = self.in_loop_body, False
+        condition_value = self.transpile(node.condition_node, True)
+        self.in_loop_body = in_loop_body
+        self.emit(f'if not {self.truth(condition_value)}: break')
+
+        self.transpile_loop_body(node.body_node, elements)
+        self.indent -= 1
+        return self.transpile_loop_value(elements)
+
+    def transpile_FuncDefNode(self, node, want_value):
+        body_name = f'function_{self.function_count}'
+        self.function_count += 1
+
+        state = (self.block, self.indent, self.temp_count, self.in_function, self.in_loop_body)
+        self.begin_block(f'def {body_name}(context, args):', True)
+
+        for index, arg_name_tok in enumerate(node.arg_name_toks):
+            self.emit(f'values[{node.scope.slots[arg_name_tok.value]}] = args[{index}]')
+
+        body_value = self.transpile(node.body_node, node.should_auto_return)
+        self.emit(f'return {body_value if node.should_auto_return else "NULL"}')
+        self.blocks.append(self.block)
+        self.block, self.indent, self.temp_count, self.in_function, self.in_loop_body = state
+
+        value = self.temp()
+        self.emit(f'{value} = python_make_function({self.node_ref(node)}, {body_name}, context)')
+
+        if node.var_name_tok:
+            if node.slot is None:
+                self.emit(f'context.symbol_table.set({node.var_name_tok.value!r}, {value})')
+            else:
+                self.emit(f'values[{node.slot}] = {value}')
+
+        return value
+
+    def transpile_CallNode(self, node, want_value):
+        value_to_call = self.transpile(node.node_to_call, True)
+        args = f'[{", ".join(self.transpile(arg_node, True) for arg_node in node.arg_nodes)}]'
+        call_node = self.node_ref(node)
+        value = self.temp()
+
+        self.emit(f'if type({value_to_call}) is PythonFunction:')
+        if node.is_tail and self.in_function:
+            located = f'{value_to_call}.located({call_node}.pos_start, {call_node}.pos_end, context)'
+            self.emit(f'    {value} = TailCall({located}, {args})')
+        else:
+            self.emit(f'    {value} = {value_to_call}.invoke({args}, context, {call_node})')
+        self.emit('else:')
+        self.emit(f'    {value} = python_call({value_to_call}, {args}, context, {call_node})')
+        return value
+
+    def transpile_ReturnNode(self, node, want_value):
+        value = self.transpile(node.node_to_return, True) if node.node_to_return else 'NULL'
+
+        if self.in_function:
+            self.emit(f'return {value}')
+        else:
+            self.emit(f'raise ReturnException({value})')
+
+        return 'NULL'
+
+    def transpile_ContinueNode(self, node, want_value):
+        self.emit('continue' if self.in_loop_body else 'raise CONTINUE_EXCEPTION.with_traceback(None)')
+        return 'NULL'
+
+    def transpile_BreakNode(self, node, want_value):
+        self.emit('break' if self.in_loop_body else 'raise BREAK_EXCEPTION.with_traceback(None)')
+        return 'NULL'
+
+
+def python_error_node():
+    # The node that the generated code calling a python_* helper reports
+    # errors at: the calling line's entry in its program's line map.
+    frame = sys._getframe(2)
+    return frame.f_globals['line_map'][frame.f_lineno]
+
+
+def python_operate(left, method_name, right, context):
+    result, error = getattr(left, method_name)(right)
+
+    if error:
+        node = python_error_node()
+        raise RTErrorException(locate_operation_error(
+            left, method_name, right,
+            (node.left_node.pos_start, node.left_node.pos_end),
+            (node.right_node.pos_start, node.right_node.pos_end),
+            context
+        ))
+
+    return result
+
+
+def python_negate(value, context):
+    result, error = value.multed_by(Number.minus_one)
+
+    if error:
+        node = python_error_node()
+        value = value.located(node.node.pos_start, node.node.pos_end, context)
+        raise RTErrorException(value.multed_by(Number.minus_one)[1])
+
+    return result
+
+
+def python_load(context, name, local_slot, global_slot):
+    value = context.symbol_table.lookup(name, local_slot, global_slot)
+
+    if not value:
+        node = python_error_node()
+        raise RTErrorException(RTError(
+            node.pos_start, node.pos_end,
+            f"'{name}' is not defined",
+            context
+        ))
+
+    return value
+
+
+def python_make_function(node, body, context):
+    func_name = node.var_name_tok.value if node.var_name_tok else None
+    arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+    return PythonFunction(func_name, node.body_node, arg_names, node.should_auto_return, body, node.scope).set_context(
+        context).set_pos(node.pos_start, node.pos_end)
+
+
+def python_call(value_to_call, args, context, node):
+    # Calls anything but a PythonFunction the way visit_CallNode does. A
+    # function passed as an argument is placed at its argument, so one that
+    # a built-in calls back (as MAP does) reads the caller's variables.
+    value_to_call = value_to_call.located(node.pos_start, node.pos_end, value_to_call.context or context)
+
+    for index, arg in enumerate(args):
+        if isinstance(arg, Function):
+            arg_node = node.arg_nodes[index]
+            args[index] = arg.located(arg_node.pos_start, arg_node.pos_end, context)
+
+    return_value = interpreter.call_value(value_to_call, args)
+    return return_value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
+
+
+PYTHON_RUNTIME = {
+    'Number': Number, 'String': String, 'List': List, 'PythonFunction': PythonFunction, 'TailCall': TailCall,
+    'NULL': Number.null, 'TRUE': Number.true, 'FALSE': Number.false,
+    'BreakException': BreakException, 'ContinueException': ContinueException, 'ReturnException': ReturnException,
+    'BREAK_EXCEPTION': BREAK_EXCEPTION, 'CONTINUE_EXCEPTION': CONTINUE_EXCEPTION,
+    'make_number': make_number, 'loop_range': loop_range, 'python_operate': python_operate,
+    'python_negate': python_negate, 'python_load': python_load, 'python_make_function': python_make_function,
+    'python_call': python_call,
+}
+
+python_code_cache = collections.OrderedDict()
+
+
+def compile_python(source):
+    # compile() is most of what the transpiler costs, so its code objects
+    # are kept for the session, keyed by a hash of the generated source.
+    # (The source depends on the slots resolved for the program, so two
+    # runs of the same script only share code when they share the layout.)
+    key = hashlib.sha256(source.encode('utf-8')).digest()
+    code = python_code_cache.get(key)
+
+    if code is None:
+        code = compile(source, '<basic>', 'exec')
+        python_code_cache[key] = code
+
+        if len(python_code_cache) > PYTHON_CODE_CACHE_SIZE:
+            python_code_cache.popitem(last=False)
+    else:
+        python_code_cache.move_to_end(key)
+
+    return code
+
+
+def run_python(node, context):
+    # Transpiles and runs a resolved program in context, returning its
+    # value. Source Python cannot compile (nested deeper than its parser
+    # allows) falls back to the interpreter.
+    source, line_map, nodes = Transpiler().transpile_program(node)
+
+    try:
+        code = compile_python(source)
+    except (SyntaxError, RecursionError):
+        return interpreter.visit(node, context)
+
+    global_table = context.symbol_table.global_table
+    namespace = dict(PYTHON_RUNTIME)
+    namespace.update(N=nodes, line_map=line_map, gvalues=global_table.values, local_names=global_table.local_names)
+    exec(code, namespace)
+    return namespace['program'](context)
+
+
+#######################################
+# PROGRAM CACHE
+#######################################
+
+BASIC_CACHE_DIR_NAME = '.basic_cache'
+BASIC_CACHE_MAX_BYTES = 16 * 1024 * 1024
+BASIC_CACHE_VERSION = 8  # Bump whenever the pickled node layout changes.
+
+PROGRAM_CACHE_CLASSES = {cls.__name__: cls for cls in (
+    SourceText, Position, Token, NumberNode, StringNode, ListNode, VarAccessNode, VarAssignNode, BinOpNode,
+    UnaryOpNode, IfNode, ForNode, WhileNode, FuncDefNode, CallNode, ReturnNode, ContinueNode, BreakNode,
+)}
+
+
+class ProgramUnpickler(pickle.Unpickler):
+    # Cache entries live in the user-writable file system, so only the
+    # classes that make up a parsed program may be loaded from them.
+    def find_class(self, module, name):
+        if module == __name__ and name in PROGRAM_CACHE_CLASSES:
+            return PROGRAM_CACHE_CLASSES[name]
+
+        raise pickle.UnpicklingError(f"'{module}.{name}' is not allowed in a program cache entry")
+
+
+class ProgramCache:
+    # Parsed programs are pickled into a hidden directory next to the scripts.
+    # Each entry is named '<script hash>.<text hash>.ast': the first hash
+    # covers the script's full name alone and picks out the entries that
+    # belong to it, the second also covers its text, so editing a script
+    # makes its old entry miss.
+    # Entry mtimes are touched on every hit and the least recently used
+    # entries are evicted once the directory grows past max_bytes.
+    #
+    # The garbage collector is paused while an entry is loaded: a program
+    # unpickles into hundreds of thousands of acyclic objects, and letting
+    # the collector rescan them as they are created triples the load time.
+    def __init__(self, directory, max_bytes=BASIC_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def script_key(self, fn):
+        return hashlib.sha256(fn.encode('utf-8')).hexdigest()[:32]
+
+    def entry_path(self, fn, text):
+        key = f'{BASIC_CACHE_VERSION}\0{fn}\0{text}'
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f'{self.script_key(fn)}.{digest}.ast')
+
+    def get(self, fn, text):
+        entry_path = self.entry_path(fn, text)
+
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            with open(entry_path, 'rb') as f:
+                node = ProgramUnpickler(f).load()
+            os.utime(entry_path)
+        except Exception:
+            return None
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        return node
+
+    def put(self, fn, text, node):
+        entry_path = self.entry_path(fn, text)
+        script_key = self.script_key(fn)
+
+        try:
+            data = pickle.dumps(node, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+
+        if len(data) > self.max_bytes:
+            return
+
+        try:
+            if not os.path.exists(self.directory):
+                os.mkdir(self.directory)
+
+            # Entries for older versions of the same script are stale.
+            for item in os.scandir(self.directory):
+                stem, _, extension = item.name.rpartition('.')
+                entry_key, _, _ = stem.rpartition('.')
+
+                if extension == 'ast' and entry_key == script_key and item.path != entry_path:
+                    os.remove(item.path)
+
+            with open(entry_path, 'wb') as f:
+                f.write(data)
+
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = [(item.stat().st_mtime, item.stat().st_size, item.path) for item in os.scandir(self.directory)
+                   if item.is_file()]
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            os.remove(path)
+            total -= size
+
+
+#######################################
+# PROFILER
+#######################################
+
+PROFILE_REPORT_LIMIT = 20
+
+
+class ProfileEntry:
+    # Counts and times for one function or source line. Time spent in a
+    # recursive entry is only added to cumulative by the outermost one.
+    __slots__ = ('name', 'calls', 'cumulative', 'self_time', 'active')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        self.active = 0
+
+    def as_dict(self):
+        return {'name': self.name, 'calls': self.calls, 'cumulative': self.cumulative, 'self': self.self_time}
+
+
+class ProfilingInterpreter(Interpreter):
+    # Runs programs like the Interpreter while timing every function call
+    # and every source line. A line is entered whenever evaluation moves to
+    # a node starting on a different line (blocks span several lines, so
+    # they are left to their statements). The lines of a function body nest
+    # under the line that called it, and self time is cumulative time less
+    # the time spent in nested lines (or, for functions, nested calls).
+    def __init__(self):
+        super().__init__()
+        self.functions = {}
+        self.lines = {}
+        self.function_names = {}
+        self.line_keys = {}
+        self.function_stack = []
+        self.line_stack = []
+        self.current_line = None
+
+    def visit(self, node, context):
+        pos = node.pos_start
+        line_key = self.line_keys.get(pos)
+
+        if line_key is None:
+            line_key = self.line_keys[pos] = (pos.fn, pos.ln)
+
+        function_name = self.function_names.get(node)
+        enters_line = line_key != self.current_line and type(node) is not ListNode
+
+        if not enters_line and function_name is None:
+            return super().visit(node, context)
+
+        line_entry = None
+        if enters_line:
+            line_entry = self.enter(self.lines, line_key, self.line_stack)
+            self.current_line = line_key
+
+        function_entry = None
+        if function_name is not None:
+            function_entry = self.enter(self.functions, function_name, self.function_stack)
+
+        try:
+            return super().visit(node, context)
+        finally:
+            if function_entry:
+                self.leave(function_entry, self.function_stack)
+
+            if line_entry:
+                self.leave(line_entry, self.line_stack)
+                self.current_line = self.line_stack[-1][0].name if self.line_stack else None
+
+    def visit_FuncDefNode(self, node, context):
+        pos = node.pos_start
+        func_name = node.var_name_tok.value if node.var_name_tok else '<anonymous>'
+        self.function_names[node.body_node] = f'{func_name} ({pos.fn}:{pos.ln + 1})'
+        return super().visit_FuncDefNode(node, context)
+
+    def call_value(self, value_to_call, args):
+        if isinstance(value_to_call, BuiltInFunction):
+            name = f'{value_to_call.name} (built-in)'
+        elif isinstance(value_to_call, BaseFunction):
+            name = f'{value_to_call.name} (memoized)' if isinstance(value_to_call, MemoizedFunction) else value_to_call.name
+        else:
+            return super().call_value(value_to_call, args)
+
+        entry = self.enter(self.functions, name, self.function_stack)
+
+        try:
+            return super().call_value(value_to_call, args)
+        finally:
+            self.leave(entry, self.function_stack)
+
+    def enter(self, entries, key, stack):
+        entry = entries.get(key)
+
+        if entry is None:
+            entry = entries[key] = ProfileEntry(key)
+
+        entry.calls += 1
+        entry.active += 1
+        stack.append([entry, time.perf_counter(), 0.0])
+        return entry
+
+    def leave(self, entry, stack):
+        _, start, child_time = stack.pop()
+        elapsed = time.perf_counter() - start
+
+        entry.self_time += elapsed - child_time
+        entry.active -= 1
+
+        if entry.active == 0:
+            entry.cumulative += elapsed
+
+        if stack:
+            stack[-1][2] += elapsed
+
+    ###################################
+
+    def as_dict(self):
+        source_lines = {pos.fn: pos.source.text.split('\n') for pos in self.line_keys}
+        functions = sorted(self.functions.values(), key=lambda entry: entry.cumulative, reverse=True)
+        lines = sorted(self.lines.values(), key=lambda entry: entry.self_time, reverse=True)
+
+        return {
+            'functions': [entry.as_dict() for entry in functions],
+            'lines': [
+                dict(entry.as_dict(), name=source_lines[fn][ln].strip(), file=fn, line=ln + 1)
+                for entry in lines
+                for fn, ln in (entry.name,)
+            ],
+        }
+
+    def report(self, limit=PROFILE_REPORT_LIMIT):
+        profile = self.as_dict()
+        result = ['Functions (by cumulative time)', f'{"calls":>10} {"cumulative":>12} {"self":>12}  function']
+
+        for entry in profile['functions'][:limit]:
+            result.append(f'{entry["calls"]:>10} {entry["cumulative"]:>12.6f} {entry["self"]:>12.6f}  {entry["name"]}')
+
+        result += ['', 'Lines (by self time)', f'{"hits":>10} {"cumulative":>12} {"self":>12}  line']
+
+        for entry in profile['lines'][:limit]:
+            result.append(f'{entry["calls"]:>10} {entry["cumulative"]:>12.6f} {entry["self"]:>12.6f}  '
+                          f'{entry["file"]}:{entry["line"]}  {entry["name"]}')
+
+        return '\n'.join(result)
+
+
+def profile_file(fn, text, global_symbol_table, cache=None, optimize=True):
+    # Runs a script with run_file on a ProfilingInterpreter, which is
+    # returned holding the results. Profiling always uses the interpreter.
+    global interpreter
+
+    profiler = ProfilingInterpreter()
+    previous_interpreter, interpreter = interpreter, profiler
+
+    try:
+        run_file(fn, text, global_symbol_table, False, cache, optimize)
+    finally:
+        interpreter = previous_interpreter
+
+    return profiler
 
 
 #######################################
 # RUN
 #######################################
 
-def run(fn, text, global_symbol_table):
-    # Generate tokens
-    lexer = Lexer(fn, text)
-    tokens, error = lexer.make_tokens()
-    if error:
-        return None, error
+def parse(fn, text, cache=None):
+    if cache:
+        node = cache.get(fn, text)
+        if node:
+            return node, None
 
-    # Generate AST
-    parser = Parser(tokens)
-    ast = parser.parse()
+    # The parser pulls tokens from the lexer as it goes, so the whole token
+    # list never exists at once. Like the lexer, it makes nothing the
+    # collector could free.
+    lexer = Lexer(fn, text)
+    tokens = lexer.generate_tokens()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        ast = Parser(tokens).parse()
+
+        # An illegal character is reported ahead of any syntax error, even
+        # one earlier in the text, so the rest is still lexed (not kept).
+        if ast.error:
+            collections.deque(tokens, maxlen=0)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    if lexer.error:
+        return None, lexer.error
     if ast.error:
         return None, ast.error
 
-    # Run program
-    interpreter = Interpreter()
-    context = Context('<program>')
+    if cache:
+        cache.put(fn, text, ast.node)
+
+    return ast.node, None
+
+
+def execute(node, global_symbol_table, use_vm=False, use_python=False, parent=None, parent_entry_pos=None):
+    # A program started by RUN or IMPORT is given the calling context as its
+    # parent, so an error in it is traced back through the caller.
+    context = Context('<program>', parent, parent_entry_pos)
     context.symbol_table = global_symbol_table
-    result = interpreter.visit(ast.node, context)
+    Resolver(global_symbol_table).resolve_program(node)
+
+    recursion_limit = sys.getrecursionlimit()
+    if not PYTHON_CALLS_USE_C_STACK:
+        sys.setrecursionlimit(max(recursion_limit, INTERPRETER_RECURSION_LIMIT))
+
+    try:
+        if use_vm:
+            code = Compiler().compile_program(node)
+            result = VirtualMachine().run(code, context)
+            return result.value, result.error
+
+        if use_python:
+            return run_python(node, context), None
+
+        return interpreter.visit(node, context), None
+    except RTErrorException as e:
+        return None, e.error
+    except ControlFlowException:
+        # A RETURN, BREAK or CONTINUE outside of any function or loop.
+        return None, None
+    except RecursionError:
+        # Nesting deep enough in one expression to run out of Python frames
+        # before reaching BASIC_MAX_CALL_DEPTH.
+        return None, RTError(node.pos_start, node.pos_end, 'Maximum recursion depth exceeded', context)
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+
+def run(fn, text, global_symbol_table, use_vm=False, optimize=True, use_python=False):
+    node, error = parse(fn, text)
+    if error:
+        return None, error
 
-    return result.value, result.error
+    if optimize:
+        node = Optimizer().optimize(node)
 
+    return execute(node, global_symbol_table, use_vm, use_python)
 
-def basic_command(args: list, as_admin: bool, file_system: FileSystem) -> str:
+
+def run_file(fn, text, global_symbol_table, use_vm=False, cache=None, optimize=True, use_python=False):
+    # The script is lexed and parsed once, so blocks can span lines. Each
+    # top-level statement is then run in order and its value echoed, the
+    # same way a single-statement line was in per-line mode.
+    node, error = parse(fn, text, cache)
+    if error:
+        print(error.as_string())
+        return
+
+    if optimize:
+        node = Optimizer().optimize(node)
+
+    for statement_node in node.element_nodes:
+        value, error = execute(statement_node, global_symbol_table, use_vm, use_python)
+
+        if error:
+            print(error.as_string())
+            return
+
+        # A top-level RETURN, BREAK or CONTINUE ends the program.
+        if value is None or is_exit_value(value):
+            return
+
+        print(repr(value))
+
+
+def is_exit_value(value):
+    return repr(value) == repr(String("!#<@>#EeXxIiTt#<@>#!"))
+
+
+def print_result(result):
+    # Returns True when the result asks the shell to exit.
+    if len(result.elements) == 1:
+        if is_exit_value(result.elements[0]):
+            return True
+
+        print(repr(result.elements[0]))
+    else:
+        print(repr(result))
+
+    return False
+
+
+#######################################
+# SESSION
+#######################################
+
+LIBRARY_CACHE_SIZE = 64
+
+library_cache = collections.OrderedDict()
+
+
+class Session:
+    # What RUN and IMPORT need from the basic command running the program:
+    # the file system that scripts are read through (by a path relative to
+    # its working directory, or an absolute virtual one) and the options to
+    # run them with. Every script in a session shares one global table.
+    #
+    # A library is run once per session and the functions it defines at the
+    # top level are kept; importing it again, from any script, binds those
+    # functions again instead of running it. Libraries are keyed by a hash
+    # of their text, and their parsed (and optimised) programs are kept in
+    # library_cache across sessions, so a library is only parsed once.
+    def __init__(self, file_system, use_vm=False, optimize=True, use_python=False, use_cache=True):
+        self.file_system = file_system
+        self.use_vm = use_vm
+        self.optimize = optimize
+        self.use_python = use_python
+        self.use_cache = use_cache
+        self.libraries = {}
+        self.importing = set()
+
+    def program_cache(self, fn):
+        if not self.use_cache:
+            return None
+
+        script_path = self.file_system.get_local_path(fn).path
+        return ProgramCache(os.path.join(os.path.dirname(script_path), BASIC_CACHE_DIR_NAME))
+
+    def run_script(self, fn, context, entry_pos):
+        # Runs a script in the global table of the calling context. Returns a
+        # message saying why it could not be loaded, the RTError it stopped
+        # with, or None.
+        message, text = self.file_system.read_file(fn)
+        if message != '':
+            return message
+
+        node, error = parse(fn, text, self.program_cache(fn))
+        if error:
+            return error.as_string()
+
+        if self.optimize:
+            node = Optimizer().optimize(node)
+
+        _, error = execute(node, context.symbol_table.global_table, self.use_vm, self.use_python, context, entry_pos)
+        return error
+
+    def import_library(self, fn, context, entry_pos):
+        # Imports a library into the global table of the calling context.
+        # Returns what run_script does.
+        global_table = context.symbol_table.global_table
+        message, text = self.file_system.read_file(fn)
+        if message != '':
+            return message
+
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        functions = self.libraries.get(digest)
+
+        if functions is None:
+            if digest in self.importing:
+                return f'Circular import of "{fn}"'
+
+            node, error = self.library_node(fn, text, digest)
+            if error:
+                return error.as_string()
+
+            self.importing.add(digest)
+
+            try:
+                _, error = execute(node, global_table, self.use_vm, self.use_python, context, entry_pos)
+            finally:
+                self.importing.discard(digest)
+
+            if error:
+                return error
+
+            functions = self.libraries[digest] = top_level_functions(node, global_table)
+
+        for name, function in functions.items():
+            global_table.set(name, function)
+
+        return None
+
+    def library_node(self, fn, text, digest):
+        key = (digest, self.optimize)
+        node = library_cache.get(key)
+
+        if node is not None:
+            library_cache.move_to_end(key)
+            return node, None
+
+        node, error = parse(fn, text, self.program_cache(fn))
+        if error:
+            return None, error
+
+        if self.optimize:
+            node = Optimizer().optimize(node)
+
+        library_cache[key] = node
+
+        if len(library_cache) > LIBRARY_CACHE_SIZE:
+            library_cache.popitem(last=False)
+
+        return node, None
+
+
+def top_level_functions(node, global_table):
+    # The functions a program has bound to names with its own top-level
+    # FUN and VAR statements, by name.
+    functions = {}
+
+    for statement_node in node.element_nodes:
+        if isinstance(statement_node, (FuncDefNode, VarAssignNode)) and statement_node.var_name_tok:
+            name = statement_node.var_name_tok.value
+            value = global_table.get(name)
+
+            if isinstance(value, BaseFunction):
+                functions[name] = value
+
+    return functions
+
+
+session = None
+
+
+def create_global_symbol_table():
     global_symbol_table = SymbolTable()
     global_symbol_table.set("NULL", Number.null)
     global_symbol_table.set("FALSE", Number.false)
@@ -2300,8 +5347,59 @@ def basic_command(args: list, as_admin: bool, file_system: FileSystem) -> str:
     global_symbol_table.set("POP", BuiltInFunction.pop)
     global_symbol_table.set("EXTEND", BuiltInFunction.extend)
     global_symbol_table.set("LEN", BuiltInFunction.len)
+    global_symbol_table.set("JOIN", BuiltInFunction.join)
+    global_symbol_table.set("SPLIT", BuiltInFunction.split)
+    global_symbol_table.set("SUBSTR", BuiltInFunction.substr)
+    global_symbol_table.set("FIND", BuiltInFunction.find)
     global_symbol_table.set("RUN", BuiltInFunction.run)
+    global_symbol_table.set("IMPORT", BuiltInFunction.import_)
     global_symbol_table.set("EXIT", BuiltInFunction.exit)
+    global_symbol_table.set("MEMOIZE", BuiltInFunction.memoize)
+    global_symbol_table.set("MEMO_STATS", BuiltInFunction.memo_stats)
+    global_symbol_table.set("RANGE", BuiltInFunction.range)
+    global_symbol_table.set("ARRAY", BuiltInFunction.array)
+    global_symbol_table.set("TO_ARRAY", BuiltInFunction.to_array)
+    global_symbol_table.set("TO_LIST", BuiltInFunction.to_list)
+    global_symbol_table.set("SUM", BuiltInFunction.sum)
+    global_symbol_table.set("MIN", BuiltInFunction.min)
+    global_symbol_table.set("MAX", BuiltInFunction.max)
+    global_symbol_table.set("DOT", BuiltInFunction.dot)
+    global_symbol_table.set("SORT", BuiltInFunction.sort)
+    global_symbol_table.set("MAP", BuiltInFunction.map)
+    global_symbol_table.set("FILTER", BuiltInFunction.filter)
+    global_symbol_table.set("REDUCE", BuiltInFunction.reduce)
+    global_symbol_table.set("REVERSE", BuiltInFunction.reverse)
+    global_symbol_table.set("INDEX_OF", BuiltInFunction.index_of)
+    global_symbol_table.set("CONTAINS", BuiltInFunction.contains)
+    global_symbol_table.set("SLICE", BuiltInFunction.slice)
+
+    return global_symbol_table
+
+
+def basic_command(args: list, as_admin: bool, file_system: FileSystem) -> str:
+    global_symbol_table = create_global_symbol_table()
+
+    profile_json = None
+    if '--profile-json' in args:
+        index = args.index('--profile-json')
+        if index + 1 >= len(args):
+            return 'Expected a file name after --profile-json'
+        profile_json = args[index + 1]
+        args = args[:index] + args[index + 2:]
+
+    use_vm = '--vm' in args
+    use_python = '--compile' in args
+    per_line = '--per-line' in args
+    use_cache = '--no-cache' not in args
+    optimize = '--no-optimize' not in args
+    profile = '--profile' in args or profile_json is not None
+    args = [arg for arg in args if arg not in ('--vm', '--compile', '--per-line', '--no-cache', '--no-optimize', '--profile')]
+
+    global session
+    session = Session(file_system, use_vm, optimize, use_python, use_cache)
+
+    if profile and len(args) == 0:
+        return 'Expected a file to profile'
 
     if len(args) == 0:
         while True:
@@ -2309,19 +5407,14 @@ def basic_command(args: list, as_admin: bool, file_system: FileSystem) -> str:
             if text.strip() == '':
                 continue
 
-            result, error = run('<stdin>', text, global_symbol_table)
+            result, error = run('<stdin>', text, global_symbol_table, use_vm, optimize, use_python)
 
             if error:
                 print(error.as_string())
             elif result:
-                if len(result.elements) == 1:
-                    if repr(result.elements[0]) == repr(String("!#<@>#EeXxIiTt#<@>#!")):
-                        break
-
-                    print(repr(result.elements[0]))
-                else:
-                    print(repr(result))
-    else:
+                if print_result(result):
+                    break
+    elif per_line:
         message, file_lines = file_system.get_file_lines(args[0])
 
         if message != '':
@@ -2330,18 +5423,34 @@ def basic_command(args: list, as_admin: bool, file_system: FileSystem) -> str:
             return f'File "{args[0]}" is empty'
         else:
             for line in file_lines:
-                result, error = run(args[0], line, global_symbol_table)
+                result, error = run(args[0], line, global_symbol_table, use_vm, optimize, use_python)
 
                 if error:
                     print(error.as_string())
                 elif result:
-                    if len(result.elements) == 1:
-                        if repr(result.elements[0]) == repr(String("!#<@>#EeXxIiTt#<@>#!")):
-                            break
+                    if print_result(result):
+                        break
 
-                        print(repr(result.elements[0]))
-                    else:
-                        print(repr(result))
+            return ''
+    else:
+        message, text = file_system.read_file(args[0])
+
+        if message != '':
+            return message
+        elif len(text) == 0:
+            return f'File "{args[0]}" is empty'
+        else:
+            cache = session.program_cache(args[0])
+
+            if not profile:
+                run_file(args[0], text, global_symbol_table, use_vm, cache, optimize, use_python)
+                return ''
+
+            profiler = profile_file(args[0], text, global_symbol_table, cache, optimize)
+            print(profiler.report())
+
+            if profile_json is not None:
+                return file_system.write_file(profile_json, json.dumps(profiler.as_dict(), indent=4))
 
             return ''
 
@@ -2356,7 +5465,14 @@ module: dict = {
             'name': 'basic',
             'keyword': 'basic',
             'description': 'Execute a BASIC script.',
-            'usage': '\tbasic - Open the BASIC shell.\n\tbasic <file> - Execute a BASIC script.',
+            'usage': '\tbasic - Open the BASIC shell.\n\tbasic <file> - Execute a BASIC script.\n\tbasic --vm '
+                     '[file] - Compile to bytecode and run on the BASIC virtual machine.\n\tbasic --compile [file] - '
+                     'Transpile to Python and run it as Python code.\n\tbasic --per-line <file> - '
+                     'Execute a BASIC script one line at a time (compatibility mode).\n\tbasic --no-cache <file> - Execute a '
+                     'BASIC script without reading or writing its parsed form in .basic_cache.\n\tbasic --no-optimize '
+                     '[file] - Skip constant folding and dead-branch elimination.\n\tbasic --profile <file> - Execute '
+                     'a BASIC script and print the calls and time of each function and line.\n\tbasic --profile-json '
+                     '<output> <file> - Also write the profile to <output> as JSON.',
             'needs_root': False,
             'needs_fs': True,
             'function': basic_command
@@ -182,6 +182,35 @@ class FileSystem:
 
         return '', lines
 
+    def get_local_path(self, filepath: str) -> Path:
+        path: Path = Path(str(filepath))
+
+        if path.path.startswith('/'):
+            return path.as_local
+        else:
+            return Path(self.cwd.path + '\\' + path.path)
+
+    def read_file(self, filepath: str) -> tuple[str, str]:
+        file_path: Path = self.get_local_path(filepath)
+
+        if os.path.exists(file_path.path) and os.path.isfile(file_path.path):
+            with open(file_path.path, 'r') as f:
+                return '', f.read()
+        else:
+            return f'No such file: {file_path.path}', ''
+
+    def write_file(self, filepath: str, text: str) -> str:
+        file_path: Path = self.get_local_path(filepath)
+        directory: str = os.path.dirname(file_path.path)
+
+        if directory and not os.path.isdir(directory):
+            return f'No such directory: {directory}'
+
+        with open(file_path.path, 'w') as f:
+            f.write(text)
+
+        return ''
+
     def rm_item(self, filepath: str, skip_confirmation: bool = False) -> str:
         path: Path = Path(str(filepath))
 